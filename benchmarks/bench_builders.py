@@ -0,0 +1,16 @@
+from datetime import date, timedelta
+
+START = date(2025, 9, 1)
+
+def test_build_notes(benchmark, main_module, synthetic):
+    synthetic.periods  # génération hors mesure
+    out = benchmark(main_module.build_notes, synthetic)
+    benchmark.extra_info["grades"] = sum(len(p["grades"]) for p in out["periods"])
+
+def test_build_lessons_30d(benchmark, main_module, synthetic):
+    out = benchmark(main_module.build_lessons, synthetic, START, START + timedelta(days=30))
+    benchmark.extra_info["lessons"] = len(out["lessons"])
+
+def test_build_homework_7d(benchmark, main_module, synthetic):
+    out = benchmark(main_module.build_homework, synthetic, START, START + timedelta(days=7))
+    benchmark.extra_info["homework"] = len(out["homework"])
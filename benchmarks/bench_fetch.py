@@ -0,0 +1,67 @@
+"""Bout en bout : /pronote/fetch via un client ASGI en process, contre le FakeClient."""
+import asyncio, itertools
+
+import httpx
+import pytest
+
+CONCURRENCY = 50
+_users = itertools.count()
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+@pytest.fixture(scope="module")
+def client(main_module, loop):
+    transport = httpx.ASGITransport(app=main_module.app)
+    c = httpx.AsyncClient(transport=transport, base_url="http://bench")
+    yield c
+    loop.run_until_complete(c.aclose())
+
+def fetch(client, username: str, **params):
+    return client.post("/pronote/fetch", params=params,
+                       json={"username": username, "password": "pw", "days": 14})
+
+def test_fetch_cold(benchmark, client, loop):
+    # utilisateur neuf à chaque appel : login + 4 sections + sérialisation
+    def run():
+        r = loop.run_until_complete(fetch(client, f"cold{next(_users)}"))
+        assert r.status_code == 200
+    benchmark(run)
+
+def test_fetch_cached(benchmark, client, loop):
+    loop.run_until_complete(fetch(client, "warm"))
+    def run():
+        r = loop.run_until_complete(fetch(client, "warm"))
+        assert r.json()["meta"]["status"]["lessons"] == "cached"
+    benchmark(run)
+
+def test_fetch_stream_ndjson(benchmark, client, loop):
+    def run():
+        r = loop.run_until_complete(fetch(client, f"stream{next(_users)}", stream="ndjson"))
+        assert r.text.count("\n") == 5
+    benchmark(run)
+
+def test_fetch_throughput(benchmark, client, loop):
+    # CONCURRENCY requêtes simultanées (utilisateurs distincts) par round
+    async def batch():
+        rs = await asyncio.gather(*[fetch(client, f"tp{next(_users)}") for _ in range(CONCURRENCY)])
+        assert all(r.status_code == 200 for r in rs)
+    benchmark.pedantic(lambda: loop.run_until_complete(batch()), rounds=10, warmup_rounds=1)
+    benchmark.extra_info["requests_per_s"] = round(CONCURRENCY / benchmark.stats.stats.median, 1)
+
+def test_fetch_latency_injected(benchmark, client, loop, monkeypatch):
+    # 50 ms par appel upstream : vérifie que les sections tournent bien en parallèle
+    monkeypatch.setenv("FAKE_LATENCY_S", "0.05")
+    monkeypatch.setenv("FAKE_LOGIN_LATENCY_S", "0.1")
+    def run():
+        r = loop.run_until_complete(fetch(client, f"lat{next(_users)}"))
+        assert r.status_code == 200
+        meta = r.json()["meta"]
+        timing = meta["timing"]
+        sections = [timing[name] for name in meta["status"]]
+        # en séquentiel, total (hors login) ≈ somme des 4 sections ; en parallèle ≈ la plus lente
+        assert timing["total_s"] - timing["login_s"] < 0.6 * sum(sections)
+    benchmark.pedantic(run, rounds=10)
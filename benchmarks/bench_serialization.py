@@ -0,0 +1,71 @@
+"""Coût CPU de la sérialisation d'une réponse /pronote/fetch.
+
+Compare le chemin FastAPI par défaut (jsonable_encoder + json stdlib, comme
+JSONResponse) au chemin ORJSONResponse renvoyé directement par l'endpoint.
+
+    python benchmarks/bench_serialization.py [nb_lessons] [taille_contenu]
+
+Les mêmes mesures tournent dans la suite pytest-benchmark (pytest benchmarks).
+"""
+import sys, json, time
+
+import orjson
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+def make_response(n_lessons: int, content_size: int) -> dict:
+    desc = ("Lorem ipsum dolor sit amet é " * (content_size // 28 + 1))[:content_size]
+    lessons = [{
+        "date": "2025-09-15", "start": "09:00", "end": "10:00",
+        "subjectId": f"S{i % 12}", "subjectLabel": f"Matière {i % 12}",
+        "room": "B12", "canceled": False,
+        "content": {"title": f"Chapitre {i}", "description": desc},
+    } for i in range(n_lessons)]
+    grades = [{
+        "date": "2025-09-10", "subjectId": f"S{i % 12}", "subjectLabel": f"Matière {i % 12}",
+        "value": 15.5, "outOf": 20.0, "coefficient": 1.0, "comment": None,
+    } for i in range(n_lessons // 4)]
+    return {
+        "notes": {"periods": [{"name": "T1", "grades": grades}]},
+        "lessons": {"lessons": lessons},
+        "lessons_next7": {"lessons": lessons[: n_lessons // 4]},
+        "homework_next7": {"homework": []},
+        "meta": {"status": {"notes": "fresh"}, "timing": {"total_s": 1.234}},
+    }
+
+def stdlib_path(body: dict) -> bytes:
+    # ce que fait FastAPI quand l'endpoint renvoie un dict
+    return json.dumps(jsonable_encoder(body), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+def orjson_path(body: dict) -> bytes:
+    return orjson.dumps(body)
+
+def cpu_per_call(fn, body: dict, min_time_s: float = 1.0) -> float:
+    n, t0 = 0, time.process_time()
+    while time.process_time() - t0 < min_time_s:
+        fn(body)
+        n += 1
+    return (time.process_time() - t0) / n
+
+SIZES = [50, 500, 2000]
+
+@pytest.mark.parametrize("n_lessons", SIZES)
+def test_serialize_jsonable_encoder(benchmark, n_lessons):
+    benchmark(stdlib_path, make_response(n_lessons, 400))
+
+@pytest.mark.parametrize("n_lessons", SIZES)
+def test_serialize_orjson(benchmark, n_lessons):
+    benchmark(orjson_path, make_response(n_lessons, 400))
+
+if __name__ == "__main__":
+    n_lessons = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    content_size = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    body = make_response(n_lessons, content_size)
+    assert orjson.loads(orjson_path(body)) == json.loads(stdlib_path(body))
+    slow = cpu_per_call(stdlib_path, body)
+    fast = cpu_per_call(orjson_path, body)
+    print(f"lessons={n_lessons} content={content_size}B size={len(orjson_path(body))}B")
+    print(f"jsonable_encoder+json : {slow * 1e3:8.3f} ms CPU/requête")
+    print(f"orjson                : {fast * 1e3:8.3f} ms CPU/requête")
+    print(f"gain                  : {slow / fast:8.1f}x ({(slow - fast) * 1e3:.3f} ms/requête)")
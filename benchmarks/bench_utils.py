@@ -0,0 +1,13 @@
+from datetime import date, datetime
+
+import pytest
+
+VALUES = [None, 15, 12.5, "15,5", " 7.25 ", "Abs", "N.Not", "", "n/a", "abc", object()]
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_safe_float(benchmark, main_module, value):
+    benchmark(main_module.safe_float, value)
+
+@pytest.mark.parametrize("value", [None, datetime(2025, 9, 15, 8), date(2025, 9, 15), "2025-09-15"], ids=repr)
+def test_fmt_dt(benchmark, main_module, value):
+    benchmark(main_module.fmt_dt, value)
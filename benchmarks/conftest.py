@@ -0,0 +1,38 @@
+"""Fixtures communes : données synthétiques de tailles croissantes et app en mode FAKE.
+
+main.py lit sa configuration à l'import : l'environnement est fixé ici, avant
+le premier import, pour que /pronote/fetch passe par fake_pronote.FakeClient.
+"""
+import os, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("MOCK", "0")
+os.environ.setdefault("PRONOTE_FAKE", "1")
+os.environ.setdefault("FAKE_LATENCY_S", "0")
+os.environ.setdefault("FAKE_JITTER_S", "0")
+os.environ.setdefault("FAKE_LOGIN_LATENCY_S", "0")
+# le benchmark de débit envoie des rafales : pas de 503 d'admission pendant la mesure
+os.environ.setdefault("EXECUTOR_QUEUE_MAX", "1024")
+# le faux serveur est local : le limiteur en amont ne doit pas fausser les chiffres
+os.environ.setdefault("UPSTREAM_CONCURRENCY", "1024")
+
+# (périodes, notes/période, cours/jour, devoirs/jour, taille du contenu)
+SIZES = {
+    "small":  dict(periods=1, grades_per_period=10, lessons_per_day=4, homework_per_day=0.5, content_size=50),
+    "medium": dict(periods=3, grades_per_period=30, lessons_per_day=7, homework_per_day=1.5, content_size=200),
+    "large":  dict(periods=3, grades_per_period=150, lessons_per_day=10, homework_per_day=4, content_size=2000),
+}
+
+@pytest.fixture(scope="session")
+def main_module():
+    import main
+    return main
+
+@pytest.fixture(params=list(SIZES), scope="session")
+def synthetic(request):
+    from fake_pronote import SyntheticData
+    return SyntheticData(seed=42, **SIZES[request.param])
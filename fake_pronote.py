@@ -0,0 +1,233 @@
+"""Données pronotepy synthétiques et faux client pour les tests de charge.
+
+Les objets imitent les attributs lus par build_notes / build_lessons /
+build_homework (main.py), pour que le mode MOCK synthétique et les benchmarks
+passent par le vrai code des builders. Tout est déterministe pour une graine donnée.
+FakeClient (PRONOTE_FAKE=1) remplace pronotepy.Client sur le chemin REAL.
+"""
+import os, random, time as _time
+from datetime import date, datetime, timedelta, time as dtime
+from types import SimpleNamespace
+from typing import List
+
+SUBJECTS = [
+    ("MATH", "Mathématiques"), ("FRAN", "Français"), ("HIST", "Histoire-Géographie"),
+    ("ANG", "Anglais"), ("ESP", "Espagnol"), ("PHY", "Physique-Chimie"), ("SVT", "SVT"),
+    ("EPS", "EPS"), ("TECH", "Technologie"), ("ARTS", "Arts plastiques"),
+    ("MUS", "Éducation musicale"), ("EMC", "EMC"),
+]
+# valeurs « non numériques » que Pronote renvoie réellement
+ODD_GRADES = ["Abs", "N.Not", "Disp", ""]
+WORDS = ("exercice chapitre page lire rédiger réviser contrôle équation carte schéma "
+         "résumé vocabulaire analyse exposé problème").split()
+
+class SyntheticData:
+    """Générateur paramétrable : périodes, notes, cours par jour, densité de devoirs."""
+
+    # pas de serveur derrière : call_upstream (main.py) ne passe ni par le limiteur ni par le disjoncteur
+    pronote_url = None
+
+    def __init__(self, periods: int = 3, grades_per_period: int = 30, lessons_per_day: int = 7,
+                 homework_per_day: float = 1.5, content_size: int = 200, seed: int = 0,
+                 n_subjects: int = len(SUBJECTS)):
+        self.n_periods = periods
+        self.grades_per_period = grades_per_period
+        self.lessons_per_day = lessons_per_day
+        self.homework_per_day = homework_per_day
+        self.content_size = content_size
+        self.seed = seed
+        self.subjects = [SimpleNamespace(code=c, name=n) for c, n in SUBJECTS[:max(1, n_subjects)]]
+        self._periods = None
+
+    @classmethod
+    def from_env(cls) -> "SyntheticData":
+        return cls(
+            periods=int(os.getenv("SYNTH_PERIODS", "3")),
+            grades_per_period=int(os.getenv("SYNTH_GRADES_PER_PERIOD", "30")),
+            lessons_per_day=int(os.getenv("SYNTH_LESSONS_PER_DAY", "7")),
+            homework_per_day=float(os.getenv("SYNTH_HOMEWORK_PER_DAY", "1.5")),
+            content_size=int(os.getenv("SYNTH_CONTENT_SIZE", "200")),
+            seed=int(os.getenv("SYNTH_SEED", "0")),
+        )
+
+    def _rng(self, *parts) -> random.Random:
+        # une graine par (jour, section) : le même jour donne les mêmes objets quel que soit l'appel
+        return random.Random(":".join(str(p) for p in (self.seed, *parts)))
+
+    def _text(self, rng: random.Random, size: int) -> str:
+        out: List[str] = []
+        n = 0
+        while n < size:
+            w = rng.choice(WORDS)
+            out.append(w)
+            n += len(w) + 1
+        return " ".join(out)[:size]
+
+    # -- notes --
+    @property
+    def periods(self):
+        if self._periods is None:
+            self._periods = [self._make_period(i) for i in range(self.n_periods)]
+        return self._periods
+
+    def _make_period(self, i: int):
+        rng = self._rng("period", i)
+        start = date(2025, 9, 1) + timedelta(days=91 * i)
+        grades = []
+        for _ in range(self.grades_per_period):
+            value = rng.choice(ODD_GRADES) if rng.random() < 0.05 else f"{rng.randint(0, 40) / 2:g}".replace(".", ",")
+            grades.append(SimpleNamespace(
+                date=start + timedelta(days=rng.randint(0, 90)),
+                subject=rng.choice(self.subjects),
+                grade=value,
+                out_of=rng.choice(["20", "20", "10", "5"]),
+                coefficient=rng.choice(["1", "1", "2", "0,5"]),
+                comment=self._text(rng, 40) if rng.random() < 0.2 else None,
+            ))
+        return SimpleNamespace(name=f"Trimestre {i + 1}", grades=grades)
+
+    # -- emploi du temps --
+    def _lessons_of_day(self, d: date):
+        per_day = self.lessons_per_day if d.weekday() < 5 else (self.lessons_per_day // 2 if d.weekday() == 5 else 0)
+        rng = self._rng("lessons", d.isoformat())
+        out = []
+        for k in range(per_day):
+            start = datetime.combine(d, dtime(8, 0)) + timedelta(hours=k)
+            out.append(SimpleNamespace(
+                id=f"L{d.isoformat()}-{k}",
+                start=start,
+                end=start + timedelta(minutes=55),
+                subject=rng.choice(self.subjects),
+                classroom=f"{rng.choice('ABCD')}{rng.randint(1, 30)}",
+                canceled=rng.random() < 0.03,
+                content=SimpleNamespace(title=self._text(rng, 30), description=self._text(rng, self.content_size))
+                if self.content_size and rng.random() < 0.6 else None,
+            ))
+        return out
+
+    def lessons(self, date_from: date, date_to: date = None):
+        date_to = date_to or date_from
+        out = []
+        d = date_from
+        while d <= date_to:
+            out.extend(self._lessons_of_day(d))
+            d += timedelta(days=1)
+        return out
+
+    # -- devoirs --
+    def _homework_due(self, d: date):
+        rng = self._rng("homework", d.isoformat())
+        if d.weekday() == 6:
+            return []
+        n = int(self.homework_per_day) + (1 if rng.random() < self.homework_per_day % 1 else 0)
+        return [SimpleNamespace(
+            id=f"hw{d.isoformat()}-{k}",
+            date=d - timedelta(days=rng.randint(1, 7)),
+            due_date=d,
+            subject=rng.choice(self.subjects),
+            description=self._text(rng, max(20, self.content_size // 2)),
+            done=rng.random() < 0.3,
+        ) for k in range(n)]
+
+    def homework(self, date_from: date, date_to: date = None):
+        date_to = date_to or date_from
+        out = []
+        d = date_from
+        while d <= date_to:
+            out.extend(self._homework_due(d))
+            d += timedelta(days=1)
+        return out
+
+# ---- Faux client ----
+class FakeUpstreamError(Exception):
+    pass
+
+class FakePeriod:
+    def __init__(self, client: "FakeClient", period):
+        self._client = client
+        self.name = period.name
+        self._grades = period.grades
+
+    @property
+    def grades(self):
+        # comme pronotepy : une requête par accès aux notes d'une période
+        self._client._call("grades")
+        return list(self._grades)
+
+class FakeClient:
+    """Remplaçant local de pronotepy.Client, avec latence, pannes et timeouts injectables.
+
+    Sert à charger le chemin REAL de /pronote/fetch (pool, executor, timeouts,
+    cache) sans serveur Pronote. Les données viennent de SyntheticData.
+    """
+
+    def __init__(self, pronote_url: str, username: str = "", password: str = "", ent=None,
+                 data: SyntheticData = None, latency_s: float = 0.2, jitter_s: float = 0.1,
+                 login_latency_s: float = 1.0, fail_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_s: float = 30.0, session_ttl_s: float = 0.0, bad_password: str = "invalid",
+                 seed: int = None):
+        self.pronote_url = pronote_url
+        self.username = username
+        self.data = data or SyntheticData()
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.login_latency_s = login_latency_s
+        self.fail_rate = fail_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_s = timeout_s
+        self.session_ttl_s = session_ttl_s
+        self._rng = random.Random(seed)
+        self.calls = {}
+        self._sleep(login_latency_s)
+        self.logged_in = password != bad_password
+        self._session_started = _time.monotonic()
+
+    @classmethod
+    def from_env(cls, pronote_url: str, username: str, password: str, ent=None) -> "FakeClient":
+        return cls(
+            pronote_url, username, password, ent,
+            data=SyntheticData.from_env(),
+            latency_s=float(os.getenv("FAKE_LATENCY_S", "0.2")),
+            jitter_s=float(os.getenv("FAKE_JITTER_S", "0.1")),
+            login_latency_s=float(os.getenv("FAKE_LOGIN_LATENCY_S", "1.0")),
+            fail_rate=float(os.getenv("FAKE_FAIL_RATE", "0")),
+            timeout_rate=float(os.getenv("FAKE_TIMEOUT_RATE", "0")),
+            timeout_s=float(os.getenv("FAKE_TIMEOUT_S", "30")),
+            session_ttl_s=float(os.getenv("FAKE_SESSION_TTL_S", "0")),
+            bad_password=os.getenv("FAKE_BAD_PASSWORD", "invalid"),
+        )
+
+    def _sleep(self, base: float):
+        if base > 0 or self.jitter_s > 0:
+            _time.sleep(max(0.0, base + self._rng.uniform(0, self.jitter_s)))
+
+    def _call(self, what: str):
+        self.calls[what] = self.calls.get(what, 0) + 1
+        r = self._rng.random()
+        if r < self.timeout_rate:
+            _time.sleep(self.timeout_s)
+            raise TimeoutError(f"fake {what}: upstream timeout")
+        self._sleep(self.latency_s)
+        if r < self.timeout_rate + self.fail_rate:
+            raise FakeUpstreamError(f"fake {what}: upstream failure")
+
+    def session_check(self) -> bool:
+        # True = session expirée puis rafraîchie, comme pronotepy
+        self._call("session_check")
+        if self.session_ttl_s and _time.monotonic() - self._session_started > self.session_ttl_s:
+            self._sleep(self.login_latency_s)
+            self._session_started = _time.monotonic()
+            return True
+        return False
+
+    @property
+    def periods(self):
+        return [FakePeriod(self, p) for p in self.data.periods]
+
+    def lessons(self, date_from: date, date_to: date = None):
+        self._call("lessons")
+        return self.data.lessons(date_from, date_to)
+
+    def homework(self, date_from: date, date_to: date = None):
+        self._call("homework")
+        return self.data.homework(date_from, date_to)
@@ -1,12 +1,19 @@
-import os, time
-from datetime import date, datetime, timedelta
-from typing import Optional, Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+import os, sys, time, random, asyncio, contextvars, hmac, hashlib, logging, secrets, sqlite3, threading, zlib
+from collections import Counter as Tally, deque
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, time as dtime
+from typing import Optional, Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FuturesTimeout
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+import orjson
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
 
 from fastapi import Request, Header, HTTPException, Depends
 
@@ -17,12 +24,107 @@ from fastapi import Depends
 
 
 load_dotenv()
+# logger d'uvicorn : les avertissements suivent la configuration de log du serveur
+log = logging.getLogger("uvicorn.error")
 
 PRONOTE_URL = os.getenv("PRONOTE_URL", "https://0061884r.index-education.net/pronote/eleve.html")
 ALLOW_ORIGINS = os.getenv("CORS_ALLOW_ORIGINS", "https://ton-front.example")
 MOCK = os.getenv("MOCK", "0").strip().lower() in {"1","true","yes"} 
 INCLUDE_CONTENT = os.getenv("INCLUDE_CONTENT", "1").strip().lower() in {"1","true","yes"}
+# MOCK synthétique : gros volumes générés (fake_pronote.py, SYNTH_*) passés dans les vrais builders
+MOCK_SYNTHETIC = os.getenv("MOCK_SYNTHETIC", "0").strip().lower() in {"1","true","yes"}
+# faux serveur Pronote local (fake_pronote.FakeClient, FAKE_*) : chemin REAL complet, sans réseau
+PRONOTE_FAKE = os.getenv("PRONOTE_FAKE", "0").strip().lower() in {"1","true","yes"}
 API_KEY = os.getenv("API_KEY", "").strip()
+ADMIN_KEY = os.getenv("ADMIN_KEY", "").strip()  # vide = endpoints /admin désactivés
+
+# Pool de sessions pronotepy (clients déjà authentifiés)
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "256"))
+POOL_IDLE_TTL_S = float(os.getenv("POOL_IDLE_TTL_S", "900"))
+POOL_CHECK_AFTER_S = float(os.getenv("POOL_CHECK_AFTER_S", "60"))
+# sel aléatoire par process si non fourni : les clés ne survivent pas au redémarrage, c'est voulu
+POOL_SALT = (os.getenv("POOL_SALT", "").strip() or secrets.token_hex(16)).encode()
+
+# Budgets par section (s) + échéance globale commune à toutes les sections
+SECTIONS = ("notes", "lessons", "lessons_next7", "homework_next7")
+TIME_BUDGET = {"notes":6.0, "lessons":6.0, "lessons_next7":4.0, "homework_next7":4.0}
+FETCH_DEADLINE_S = float(os.getenv("FETCH_DEADLINE_S", "6.0"))
+
+# Cache des sections (TTL par section ; au-delà de CACHE_STALE_S une entrée n'est plus servie)
+CACHE_TTL_S = {
+    "notes": float(os.getenv("CACHE_TTL_NOTES_S", "3600")),
+    "lessons": float(os.getenv("CACHE_TTL_LESSONS_S", "900")),
+    "lessons_next7": float(os.getenv("CACHE_TTL_LESSONS_NEXT7_S", "900")),
+    "homework_next7": float(os.getenv("CACHE_TTL_HOMEWORK_S", "600")),
+}
+CACHE_STALE_S = float(os.getenv("CACHE_STALE_S", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "4096"))
+
+# Tracing OpenTelemetry optionnel (paquets opentelemetry-* non requis si désactivé)
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "0").strip().lower() in {"1","true","yes"}
+OTEL_EXPORTER = os.getenv("OTEL_EXPORTER", "otlp").strip().lower()  # otlp | file
+OTEL_FILE_PATH = os.getenv("OTEL_FILE_PATH", "traces.jsonl")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "pronote-api")
+
+# Profilage par échantillonnage : à la demande (/admin/profile) et automatique au-delà d'un seuil
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_S", "0.005"))
+PROFILE_MAX_SAMPLES = int(os.getenv("PROFILE_MAX_SAMPLES", "50000"))
+PROFILE_SLOW_S = float(os.getenv("PROFILE_SLOW_S", "0"))  # 0 = mode automatique désactivé
+PROFILE_SLOW_KEEP = int(os.getenv("PROFILE_SLOW_KEEP", "20"))
+
+# Sync incrémentale : manifestes (id -> hash) gardés en mémoire pour calculer les diffs
+SYNC_MAX_MANIFESTS = int(os.getenv("SYNC_MAX_MANIFESTS", "4096"))
+
+# Cache persistant SQLite (optionnel) : survit aux redémarrages. Nécessite un POOL_SALT fixe,
+# sinon les clés dérivées des identifiants changent à chaque démarrage et rien n'est retrouvé.
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "").strip()
+CACHE_SQLITE_MAX_ROWS = int(os.getenv("CACHE_SQLITE_MAX_ROWS", "50000"))
+# Coalescence entre workers (via le même fichier SQLite) : un seul worker récupère à la fois les mêmes
+# sections d'un compte, les autres attendent ses écritures au lieu de refaire un login en amont.
+# Active seulement si WORKERS > 1 (nombre de processus partageant le fichier) : avec un seul
+# processus, le single-flight en mémoire suffit et un miss ne paie pas d'aller-retour SQLite
+CROSS_FLIGHT_LEASE_S = float(os.getenv("CROSS_FLIGHT_LEASE_S", "30"))
+CROSS_FLIGHT_WAIT_S = float(os.getenv("CROSS_FLIGHT_WAIT_S", "15"))
+CROSS_FLIGHT_POLL_S = float(os.getenv("CROSS_FLIGHT_POLL_S", "0.1"))
+WORKERS = int(os.getenv("WORKERS", "1"))
+
+# Préchauffage (optionnel) : avant chaque pic (heure locale), rafraîchit les sections « semaine à venir »
+# des utilisateurs actifs récemment, étalé au hasard sur PREWARM_LEAD_S et plafonné en concurrence
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "0").strip().lower() in {"1","true","yes"}
+PREWARM_WINDOWS = os.getenv("PREWARM_WINDOWS", "06:45-08:00,17:00-20:00")
+PREWARM_LEAD_S = float(os.getenv("PREWARM_LEAD_S", "600"))
+PREWARM_ACTIVE_S = float(os.getenv("PREWARM_ACTIVE_S", str(7 * 86400)))
+PREWARM_MAX_USERS = int(os.getenv("PREWARM_MAX_USERS", "2000"))
+PREWARM_CONCURRENCY = int(os.getenv("PREWARM_CONCURRENCY", "2"))
+PREWARM_SECTIONS = ("homework_next7", "lessons_next7")
+
+# Limiteurs en amont (sémaphore + seau à jetons), un par serveur Pronote et un par ENT.
+# RATE_PER_S = 0 : pas de limite de débit, seulement de concurrence ; BURST = 0 : égal à la concurrence
+UPSTREAM_LIMITS = {
+    "server": (int(os.getenv("UPSTREAM_CONCURRENCY", "8")), float(os.getenv("UPSTREAM_RATE_PER_S", "0")),
+               int(os.getenv("UPSTREAM_BURST", "0"))),
+    "ent": (int(os.getenv("ENT_CONCURRENCY", "4")), float(os.getenv("ENT_RATE_PER_S", "0")),
+            int(os.getenv("ENT_BURST", "0"))),
+}
+UPSTREAM_LOGIN_WAIT_S = float(os.getenv("UPSTREAM_LOGIN_WAIT_S", "10"))
+# Disjoncteur par serveur / ENT : s'ouvre au-delà de CIRCUIT_FAILURE_RATE d'échecs sur la fenêtre
+# (au moins CIRCUIT_MIN_CALLS appels), reste ouvert CIRCUIT_OPEN_S puis laisse passer quelques sondes
+CIRCUIT_WINDOW_S = float(os.getenv("CIRCUIT_WINDOW_S", "60"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_S = float(os.getenv("CIRCUIT_OPEN_S", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+# Executor partagé (durée de vie de l'app) + file bornée
+EXECUTOR_WORKERS = int(os.getenv("EXECUTOR_WORKERS", "16"))
+EXECUTOR_QUEUE_MAX = int(os.getenv("EXECUTOR_QUEUE_MAX", "64"))
+BUSY_RETRY_AFTER_S = int(os.getenv("BUSY_RETRY_AFTER_S", "2"))
+
+def require_admin_key(x_admin_key: str | None = Header(None)):
+    if not ADMIN_KEY:
+        raise HTTPException(403, "admin_disabled")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_KEY):
+        raise HTTPException(401, "invalid_admin_key")
 
 def require_api_key(request: Request, x_api_key: str | None = Header(None)):
     # Ne pas valider pour preflight OPTIONS
@@ -47,6 +149,24 @@ def safe_float(v):
             return None
     return None
 
+def opt_str(v) -> Optional[str]:
+    # les builders ne sortent que des primitives JSON : orjson sérialise sans jsonable_encoder
+    return None if v is None else str(v)
+
+def content_hash(obj: Any) -> str:
+    # clés triées : même contenu -> même hash, quel que soit l'ordre de construction du dict
+    return hashlib.blake2b(orjson.dumps(obj, option=orjson.OPT_SORT_KEYS), digest_size=12).hexdigest()
+
+def etag_for(hashes: Dict[str, str], *ranges: date) -> str:
+    # ETag fort : hash des sections (+ plages), jamais de meta.timing/status/cache_age
+    return '"' + content_hash({"sections": hashes, "ranges": [d.isoformat() for d in ranges]}) + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip() for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
 def fmt_dt(d) -> Optional[str]:
     try:
         if d is None:
@@ -66,9 +186,25 @@ class FetchPayload(BaseModel):
     days: int = 7
     start: Optional[str] = None
     end:   Optional[str] = None
+    sections: Optional[List[str]] = None  # None = toutes les sections
+
+class SyncPayload(FetchPayload):
+    cursor: Optional[str] = None  # renvoyé par le /pronote/sync précédent ; absent = synchro complète
 
 # ---- App ----
-app = FastAPI(title="Pronote JSON API (optimisée)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PROFILE_SLOW_S:
+        profiler.start()
+    if PREWARM_ENABLED and not MOCK:
+        prewarm.start()
+    yield
+    await prewarm.stop()
+    executor.shutdown()
+    if section_cache.store is not None:
+        section_cache.store.close()
+
+app = FastAPI(title="Pronote JSON API (optimisée)", lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -91,6 +227,57 @@ app.add_middleware(
 
 )
 
+# ---- Tracing (optionnel) ----
+tracer = None
+
+def setup_tracing():
+    """Span par requête (FastAPI), login, sections et requêtes HTTP de pronotepy (requests)."""
+    global tracer
+    if not OTEL_ENABLED:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        log.warning("OTEL_ENABLED=1 mais opentelemetry-sdk absent : tracing désactivé")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    if OTEL_EXPORTER == "file":
+        # une ligne JSON par span, pour analyse hors ligne
+        out = open(OTEL_FILE_PATH, "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(out=out, formatter=lambda s: s.to_json(indent=None) + "\n")
+    else:
+        # collecteur local : OTEL_EXPORTER_OTLP_ENDPOINT (défaut http://localhost:4318)
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter()
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    tracer = trace.get_tracer("pronote-api")
+
+    try:
+        from opentelemetry.instrumentation.requests import RequestsInstrumentor
+        RequestsInstrumentor().instrument()
+    except ImportError:
+        pass
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        FastAPIInstrumentor.instrument_app(app, excluded_urls="ping,metrics")
+    except ImportError:
+        pass
+
+@contextmanager
+def span(name: str, **attrs):
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=attrs) as s:
+        yield s
+
+setup_tracing()
+
 # ---- MOCK ----
 MOCK_NOTES = {"periods":[{"name":"T1","grades":[
     {"date":"2025-09-10","subjectId":"MATH","subjectLabel":"Maths","value":15,"outOf":20},
@@ -99,33 +286,97 @@ MOCK_NOTES = {"periods":[{"name":"T1","grades":[
 MOCK_LESSONS_PAST = {"lessons":[{"date":"2025-09-15","start":"09:00","end":"10:00","subjectId":"MATH","subjectLabel":"Maths","room":"B12","canceled":False}]}
 MOCK_LESSONS_NEXT7 = {"lessons":[{"date":"2025-09-18","start":"14:00","end":"15:00","subjectId":"PHY","subjectLabel":"Physique","room":"Labo","canceled":False}]}
 MOCK_HOMEWORK_NEXT7 = {"homework":[{"id":"hw1","given":"2025-09-15","due":"2025-09-18","subjectId":"MATH","subjectLabel":"Maths","title":"Exos 12-15","description":"Équations","done":False}]}
+MOCK_SECTIONS = {"notes": MOCK_NOTES, "lessons": MOCK_LESSONS_PAST, "lessons_next7": MOCK_LESSONS_NEXT7, "homework_next7": MOCK_HOMEWORK_NEXT7}
+
+# MOCK = baseline de charge : les sections constantes sont encodées une seule fois,
+# seule la meta (plages, timing) est sérialisée à chaque requête
+@lru_cache(maxsize=None)
+def mock_body_prefix(sections: Tuple[str, ...]) -> bytes:
+    return b"{" + b"".join(orjson.dumps(name) + b":" + orjson.dumps(MOCK_SECTIONS[name]) + b"," for name in sections)
+
+mock_body_prefix(SECTIONS)
+MOCK_HASHES = {name: content_hash(data) for name, data in MOCK_SECTIONS.items()}
 
 @app.get("/ping")
 def ping():
-    return {"ok": True, "mode": "MOCK" if MOCK else "REAL", "include_content": INCLUDE_CONTENT}
+    return {
+        "ok": True, "mode": "MOCK" if MOCK else ("FAKE" if PRONOTE_FAKE else "REAL"), "include_content": INCLUDE_CONTENT,
+        "executor": executor.stats(),
+        "pool": session_pool.stats(),
+        "cache": section_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "upstream": upstream_stats(),
+        "circuits": circuit_stats(),
+        "prewarm": prewarm.stats(),
+    }
 
 # ---- Core helpers (sync) ----
-def build_notes(client) -> Dict[str, Any]:
+class SectionCancelled(Exception):
+    pass
+
+class Deadline:
+    """Jeton d'annulation coopérative, vérifié entre deux appels upstream."""
+
+    def __init__(self, budget_s: float):
+        self.expires_at = time.monotonic() + budget_s
+        self._cancelled = False
+        self.waited_s = 0.0  # attente cumulée devant les limiteurs en amont (appels successifs de la section)
+
+    def cancel(self):
+        self._cancelled = True
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self):
+        if self._cancelled or self.remaining() <= 0:
+            raise SectionCancelled()
+
+def call_upstream(client, token: Optional[Deadline], fn, *args):
+    # point d'annulation : une section abandonnée s'arrête avant le prochain appel réseau
+    if token is not None:
+        token.check()
+    # limiteur/disjoncteur du serveur du client ; données synthétiques (pronote_url = None) : aucun
+    server = getattr(client, "pronote_url", PRONOTE_URL)
+    if server is None:
+        return fn(*args)
+    with upstream_slot("server", server, token):
+        return fn(*args)
+
+def week_chunks(start_d: date, end_d: date):
+    # découpage lundi→dimanche : une requête Pronote par semaine, comme pronotepy en interne
+    d = start_d
+    while d <= end_d:
+        chunk_end = min(end_d, d + timedelta(days=6 - d.weekday()))
+        yield d, chunk_end
+        d = chunk_end + timedelta(days=1)
+
+def build_notes(client, token: Optional[Deadline] = None) -> Dict[str, Any]:
     out = {"periods": []}
+    # client.periods est lu localement (données de session) : point d'annulation seulement, pas de créneau
+    if token is not None:
+        token.check()
     for period in client.periods:
         grades = []
-        for g in sorted(period.grades, key=lambda x: x.date or date.min):
+        for g in sorted(call_upstream(client, token, lambda: period.grades), key=lambda x: x.date or date.min):
             subj_name = getattr(g.subject, "name", g.subject)
             subj_code = getattr(g.subject, "code", None)
             grades.append({
                 "date": g.date.strftime("%Y-%m-%d") if g.date else None,
-                "subjectId": subj_code or subj_name,
-                "subjectLabel": subj_name,
+                "subjectId": opt_str(subj_code or subj_name),
+                "subjectLabel": opt_str(subj_name),
                 "value": safe_float(getattr(g, "grade", None)),
                 "outOf": safe_float(getattr(g, "out_of", None)),
                 "coefficient": safe_float(getattr(g, "coefficient", None)),
-                "comment": getattr(g, "comment", None),
+                "comment": opt_str(getattr(g, "comment", None)),
             })
-        out["periods"].append({"name": period.name, "grades": grades})
+        out["periods"].append({"name": opt_str(period.name), "grades": grades})
     return out
 
-def build_lessons(client, start_d: date, end_d: date) -> Dict[str, Any]:
-    lessons = client.lessons(start_d, end_d)
+def build_lessons(client, start_d: date, end_d: date, token: Optional[Deadline] = None) -> Dict[str, Any]:
+    lessons = []
+    for a, b in week_chunks(start_d, end_d):
+        lessons.extend(call_upstream(client, token, client.lessons, a, b))
     lessons.sort(key=lambda c: (c.start, c.end))
     arr: List[Dict[str, Any]] = []
     for c in lessons:
@@ -135,26 +386,24 @@ def build_lessons(client, start_d: date, end_d: date) -> Dict[str, Any]:
         content = None
         if INCLUDE_CONTENT:
             content = {
-                "title": getattr(getattr(c, "content", None), "title", None),
-                "description": getattr(getattr(c, "content", None), "description", None)
+                "title": opt_str(getattr(getattr(c, "content", None), "title", None)),
+                "description": opt_str(getattr(getattr(c, "content", None), "description", None))
             }
         arr.append({
             "date": c.start.strftime("%Y-%m-%d"),
             "start": c.start.strftime("%H:%M"),
             "end": c.end.strftime("%H:%M"),
-            "subjectId": subj_code or subj_name,
-            "subjectLabel": subj_name,
-            "room": c.classroom or None,
+            "subjectId": opt_str(subj_code or subj_name),
+            "subjectLabel": opt_str(subj_name),
+            "room": opt_str(c.classroom or None),
             "canceled": bool(c.canceled),
             **({"content": content} if INCLUDE_CONTENT else {})
         })
     return {"lessons": arr}
 
-def build_homework(client, start_d: date, end_d: date) -> Dict[str, Any]:
-    try:
-        hws = client.homework(start_d, end_d)
-    except Exception:
-        hws = getattr(client, "homeworks", lambda a,b: [])(start_d, end_d)
+def build_homework(client, start_d: date, end_d: date, token: Optional[Deadline] = None) -> Dict[str, Any]:
+    # une erreur en amont doit remonter : une liste vide serait mise en cache comme « fresh »
+    hws = call_upstream(client, token, client.homework, start_d, end_d)
     arr: List[Dict[str, Any]] = []
     for h in sorted(hws, key=lambda x: getattr(x, "due_date", None) or getattr(x, "date", None) or date.max):
         subj = getattr(h, "subject", None)
@@ -163,118 +412,1561 @@ def build_homework(client, start_d: date, end_d: date) -> Dict[str, Any]:
         given = getattr(h, "date", None) or getattr(h, "assigned_date", None) or getattr(h, "given_date", None)
         due   = getattr(h, "due_date", None) or getattr(h, "for_date", None)
         arr.append({
-            "id": getattr(h, "id", None) or f"hw_{fmt_dt(given)}_{subj_code or subj_name}",
+            "id": opt_str(getattr(h, "id", None) or f"hw_{fmt_dt(given)}_{subj_code or subj_name}"),
             "given": fmt_dt(given),
             "due": fmt_dt(due),
-            "subjectId": subj_code or subj_name,
-            "subjectLabel": subj_name,
-            "title": getattr(h, "title", None) or getattr(h, "description", None),
-            "description": getattr(h, "description", None),
+            "subjectId": opt_str(subj_code or subj_name),
+            "subjectLabel": opt_str(subj_name),
+            "title": opt_str(getattr(h, "title", None) or getattr(h, "description", None)),
+            "description": opt_str(getattr(h, "description", None)),
             "done": bool(getattr(h, "done", False)),
         })
     return {"homework": arr}
 
-def with_timeout(executor: ThreadPoolExecutor, fn, timeout_s: float):
-    fut = executor.submit(fn)
-    return fut.result(timeout=timeout_s)
+# ---- Upstream limiter ----
+class UpstreamThrottled(Exception):
+    pass
 
-@app.post("/pronote/fetch")
-def pronote_fetch(payload: FetchPayload):
-    t0 = time.perf_counter()
-    # Plages
-    if payload.start and payload.end:
-        start_d = datetime.fromisoformat(payload.start).date()
-        end_d   = datetime.fromisoformat(payload.end).date()
+class UpstreamLimiter:
+    """Borne la charge envoyée à un serveur : N appels simultanés et un débit moyen (seau à jetons).
+
+    Bloquant, appelé depuis les workers de l'executor ; l'attente est bornée par le timeout.
+    """
+
+    def __init__(self, concurrency: int, rate_per_s: float, burst: int):
+        self.concurrency = concurrency
+        self.rate_per_s = rate_per_s
+        self.burst = burst or max(1, concurrency)
+        self._sem = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.throttled = 0
+
+    def _take_token(self) -> float:
+        # 0 si un jeton a été pris, sinon délai avant le prochain
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_per_s
+
+    def acquire(self, timeout: float) -> float:
+        t0 = time.monotonic()
+        give_up = t0 + max(0.0, timeout)
+        with self._lock:
+            self.waiting += 1
+        try:
+            if self._sem is not None and not self._sem.acquire(timeout=max(0.0, give_up - time.monotonic())):
+                raise UpstreamThrottled()
+            try:
+                while self.rate_per_s > 0 and (delay := self._take_token()):
+                    if time.monotonic() + delay > give_up:
+                        raise UpstreamThrottled()
+                    time.sleep(delay)
+            except UpstreamThrottled:
+                if self._sem is not None:
+                    self._sem.release()
+                raise
+        except UpstreamThrottled:
+            with self._lock:
+                self.throttled += 1
+            raise
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_use += 1
+        return time.monotonic() - t0
+
+    def release(self):
+        with self._lock:
+            self.in_use -= 1
+        if self._sem is not None:
+            self._sem.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"concurrency": self.concurrency, "rate_per_s": self.rate_per_s, "in_use": self.in_use,
+                    "waiting": self.waiting, "throttled": self.throttled}
+
+class CircuitOpen(Exception):
+    pass
+
+class CircuitBreaker:
+    """closed -> open si le taux d'échec dépasse le seuil ; open -> half_open après open_s.
+
+    En half_open, `probes` appels passent : un succès referme, un échec rouvre pour open_s.
+    Les appels refusés échouent immédiatement (CircuitOpen) au lieu d'attendre un timeout.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, kind: str, key: str, window_s: float, min_calls: int, failure_rate: float,
+                 open_s: float, probes: int):
+        self.kind, self.key = kind, key
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_s = open_s
+        self.probes = probes
+        self._outcomes: "deque[Tuple[float, bool]]" = deque()
+        self._failures = 0
+        self._probing = 0
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.rejected = 0
+
+    def _set(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.labels(self.kind, self.key).set(self.STATES[state])
+
+    def _open(self, now: float):
+        self._set("open")
+        self.opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+    def retry_after(self) -> float:
+        # > 0 tant que le circuit est ouvert ; 0 dès qu'une sonde pourrait passer
+        with self._lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.opened_at + self.open_s - time.monotonic())
+
+    def admit(self) -> bool:
+        """Lève CircuitOpen si l'appel est refusé ; True si l'appel est une sonde half_open."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() >= self.opened_at + self.open_s:
+                self._set("half_open")
+            if self.state == "closed":
+                return False
+            if self.state == "half_open" and self._probing < self.probes:
+                self._probing += 1
+                return True
+            self.rejected += 1
+        CIRCUIT_REJECTED.labels(self.kind, self.key).inc()
+        raise CircuitOpen(f"{self.kind} {self.key}")
+
+    def record(self, ok: Optional[bool], probe: bool):
+        # ok=None : issue neutre (annulation, limiteur, identifiants), ne compte pas comme échec
+        now = time.monotonic()
+        with self._lock:
+            if probe:
+                self._probing -= 1
+                if ok is not None and self.state == "half_open":
+                    if ok:
+                        self._set("closed")
+                    else:
+                        self._open(now)
+                return
+            if ok is None or self.state != "closed":
+                return  # résultat tardif d'un appel admis avant l'ouverture
+            self._outcomes.append((now, ok))
+            self._failures += not ok
+            while self._outcomes and self._outcomes[0][0] < now - self.window_s:
+                self._failures -= not self._outcomes.popleft()[1]
+            n = len(self._outcomes)
+            if n >= self.min_calls and self._failures / n >= self.failure_rate:
+                self._open(now)
+
+    def stats(self) -> Dict[str, Any]:
+        retry_after = self.retry_after()
+        with self._lock:
+            return {"state": self.state, "calls": len(self._outcomes), "failures": self._failures,
+                    "rejected": self.rejected, "retry_after_s": round(retry_after, 1)}
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+def circuit_breaker(kind: str, key: str) -> CircuitBreaker:
+    with _limiters_lock:
+        breaker = _breakers.get((kind, key))
+        if breaker is None:
+            breaker = _breakers[(kind, key)] = CircuitBreaker(
+                kind, key, CIRCUIT_WINDOW_S, CIRCUIT_MIN_CALLS, CIRCUIT_FAILURE_RATE,
+                CIRCUIT_OPEN_S, CIRCUIT_HALF_OPEN_PROBES)
+        return breaker
+
+def upstream_unavailable(retry_after_s: float) -> HTTPException:
+    return HTTPException(503, "upstream_unavailable", headers={"Retry-After": str(max(1, round(retry_after_s)))})
+
+def upstream_fault(e: BaseException) -> bool:
+    # imputable au serveur ? pas les annulations, nos propres 503/401, ni un mot de passe ENT refusé ;
+    # déjà compté par un créneau imbriqué (ENT dans le login) : pas une deuxième fois
+    if isinstance(e, (SectionCancelled, HTTPException)) or type(e).__name__ == "ENTLoginError":
+        return False
+    return not getattr(e, "circuit_recorded", False)
+
+_limiters: Dict[Tuple[str, str], UpstreamLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def upstream_limiter(kind: str, key: str) -> UpstreamLimiter:
+    # un limiteur par (type, serveur) : "server" = URL Pronote, "ent" = nom de l'ENT
+    with _limiters_lock:
+        lim = _limiters.get((kind, key))
+        if lim is None:
+            lim = _limiters[(kind, key)] = UpstreamLimiter(*UPSTREAM_LIMITS[kind])
+        return lim
+
+@contextmanager
+def upstream_slot(kind: str, key: str, token: Optional[Deadline] = None, phases: Optional[Dict[str, Any]] = None):
+    # disjoncteur d'abord (échec immédiat), puis limiteur :
+    # sections : attente bornée par le budget restant ; login : par UPSTREAM_LOGIN_WAIT_S
+    breaker = circuit_breaker(kind, key)
+    try:
+        probe = breaker.admit()
+    except CircuitOpen:
+        if token is not None:
+            raise
+        raise upstream_unavailable(breaker.retry_after())
+    lim = upstream_limiter(kind, key)
+    try:
+        waited = lim.acquire(token.remaining() if token is not None else UPSTREAM_LOGIN_WAIT_S)
+    except UpstreamThrottled:
+        breaker.record(None, probe)
+        UPSTREAM_THROTTLED.labels(kind, key).inc()
+        if token is not None:
+            raise SectionCancelled()
+        raise HTTPException(503, "upstream_busy", headers={"Retry-After": str(BUSY_RETRY_AFTER_S)})
+    UPSTREAM_WAIT_SECONDS.labels(kind, key).observe(waited)
+    if token is not None:
+        token.waited_s += waited
+    if phases is not None:
+        phases["upstream_wait_s"] = round(phases.get("upstream_wait_s", 0.0) + waited, 3)
+    try:
+        yield
+    except Exception as e:
+        fault = upstream_fault(e)
+        breaker.record(False if fault else None, probe)
+        if fault:
+            e.circuit_recorded = True
+        raise
     else:
-        end_d = date.today()
-        start_d = end_d - timedelta(days=max(1, payload.days))
-    f_start = date.today()
-    f_end   = f_start + timedelta(days=7)
+        breaker.record(True, probe)
+    finally:
+        lim.release()
 
-    if MOCK:
-        return {
-            "notes": MOCK_NOTES,
-            "lessons": MOCK_LESSONS_PAST,
-            "lessons_next7": MOCK_LESSONS_NEXT7,
-            "homework_next7": MOCK_HOMEWORK_NEXT7,
-            "meta": {
-                "school_url": "MOCK",
-                "range_past": {"start": start_d.isoformat(), "end": end_d.isoformat()},
-                "range_next7": {"start": f_start.isoformat(), "end": f_end.isoformat()},
-                "status": {"notes":"ok","lessons":"ok","lessons_next7":"ok","homework_next7":"ok"},
-                "timing": {"total_s": round(time.perf_counter()-t0, 3)}
-            }
-        }
+def upstream_stats() -> Dict[str, Any]:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {f"{kind}:{key}": lim.stats() for (kind, key), lim in limiters.items()}
+
+def circuit_stats() -> Dict[str, Any]:
+    with _limiters_lock:
+        breakers = dict(_breakers)
+    return {f"{kind}:{key}": b.stats() for (kind, key), b in breakers.items()}
+
+# le login traverse l'ENT puis le serveur : l'un des deux coupé suffit à le faire échouer
+LOGIN_UPSTREAMS = (("ent", "atrium_sud"), ("server", PRONOTE_URL))
+
+def login_retry_after() -> float:
+    # 0 si un login peut passer, sinon l'attente du disjoncteur ouvert le plus long
+    with _limiters_lock:
+        breakers = [_breakers[k] for k in LOGIN_UPSTREAMS if k in _breakers]
+    return max((b.retry_after() for b in breakers), default=0.0)
+
+# ---- Session pool ----
+def credential_key(username: str, password: str, url: str = PRONOTE_URL) -> str:
+    # HMAC salé : jamais le mot de passe en clair comme clé de dict
+    msg = "\0".join((url, username, password)).encode()
+    return hmac.new(POOL_SALT, msg, hashlib.sha256).hexdigest()
+
+def pronote_login(username: str, password: str, phases: Optional[Dict[str, Any]] = None):
+    # phases : ent_s (CAS + redirections ENT) et session_setup_s (init de la session Pronote)
+    phases = {} if phases is None else phases
+    t1 = time.perf_counter()
+    if PRONOTE_FAKE:
+        from fake_pronote import FakeClient
+        with upstream_slot("server", PRONOTE_URL, phases=phases), span("login", server=PRONOTE_URL, fake=True):
+            client = FakeClient.from_env(PRONOTE_URL, username=username, password=password)
+        phases["session_setup_s"] = round(time.perf_counter()-t1-phases.get("upstream_wait_s", 0.0), 3)
+        return client
+
+    import pronotepy
+    ver = getattr(pronotepy, "__version__", "unknown")
+    if ver != "2.14.4":
+        raise HTTPException(500, f"pronotepy {ver} détecté — attendu 2.14.4")
+    from pronotepy.ent import atrium_sud
+
+    def timed_ent(*args, **kwargs):
+        with upstream_slot("ent", "atrium_sud", phases=phases):
+            t_ent = time.perf_counter()
+            try:
+                with span("login ent", ent="atrium_sud"):
+                    return atrium_sud(*args, **kwargs)
+            finally:
+                phases["ent_s"] = round(time.perf_counter()-t_ent, 3)
 
-    # --- REAL ---
     try:
-        import pronotepy
-        ver = getattr(pronotepy, "__version__", "unknown")
-        if ver != "2.14.4":
-            raise HTTPException(500, f"pronotepy {ver} détecté — attendu 2.14.4")
-        from pronotepy.ent import atrium_sud
+        with upstream_slot("server", PRONOTE_URL, phases=phases), span("login", server=PRONOTE_URL):
+            return pronotepy.Client(PRONOTE_URL, username=username, password=password, ent=timed_ent)
+    finally:
+        phases["session_setup_s"] = round(
+            time.perf_counter()-t1-phases.get("ent_s", 0.0)-phases.get("upstream_wait_s", 0.0), 3)
+
+class SessionPool:
+    """Clients pronotepy connectés, réutilisés entre requêtes (LRU + TTL d'inactivité)."""
+
+    def __init__(self, login, max_size: int, idle_ttl_s: float, check_after_s: float):
+        self._login = login
+        self.max_size = max_size
+        self.idle_ttl_s = idle_ttl_s
+        self.check_after_s = check_after_s
+        # clé -> [client, dernier usage (monotonic)]
+        self._entries: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        while self._entries:
+            key, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.idle_ttl_s:
+                break
+            del self._entries[key]
+
+    def get(self, key: str, username: str, password: str, phases: Optional[Dict[str, Any]] = None):
+        # phases["session"] : reused (sans vérif), checked (session_check ok) ou login
+        phases = {} if phases is None else phases
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                client, last_used = entry
+                entry[1] = now
+
+        if entry is not None:
+            if now - last_used < self.check_after_s:
+                phases["session"] = "reused"
+                return client
+            t1 = time.perf_counter()
+            try:
+                # session_check relance elle-même la session si elle a expiré côté Pronote
+                with upstream_slot("server", PRONOTE_URL, phases=phases), span("session_check"):
+                    client.session_check()
+                if client.logged_in:
+                    phases["session"] = "checked"
+                    return client
+            except HTTPException:
+                raise  # limiteur saturé : la session reste dans le pool
+            except Exception:
+                pass
+            finally:
+                phases["session_check_s"] = round(time.perf_counter()-t1-phases.get("upstream_wait_s", 0.0), 3)
+            self.discard(key)
 
-        client = pronotepy.Client(PRONOTE_URL, username=payload.username, password=payload.password, ent=atrium_sud)
+        phases["session"] = "login"
+        client = self._login(username, password, phases)
         if not client.logged_in:
             raise HTTPException(401, "invalid_credentials")
+        with self._lock:
+            self._entries[key] = [client, time.monotonic()]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return client
 
-        status: Dict[str,str] = {}
-        timing: Dict[str,float] = {}
-        errors: Dict[str,str] = {}
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size}
+
+session_pool = SessionPool(pronote_login, POOL_MAX_SIZE, POOL_IDLE_TTL_S, POOL_CHECK_AFTER_S)
+
+# ---- Shared executor ----
+class ExecutorSaturated(Exception):
+    pass
+
+class BoundedExecutor:
+    """ThreadPoolExecutor unique pour tout le process, avec file d'attente bornée.
+
+    L'admission est « tout ou rien » : une requête réserve toutes ses sections
+    d'un coup ou est refusée immédiatement (503) au lieu de s'empiler.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._ex = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pronote")
+        self._lock = threading.Lock()
+        self._pending = 0  # soumis, pas encore terminés (en file + en cours)
+        self._active = 0
+        self.rejected = 0
+
+    def has_capacity(self, n: int = 1) -> bool:
+        with self._lock:
+            return self._pending + n <= self.max_workers + self.max_queue
+
+    def _run(self, ctx: contextvars.Context, fn, args):
+        with self._lock:
+            self._active += 1
+        try:
+            # contexte de l'appelant (span OpenTelemetry courant notamment) rejoué dans le worker
+            return ctx.run(fn, *args)
+        finally:
+            with self._lock:
+                self._active -= 1
 
+    def _done(self, _fut: Future):
+        with self._lock:
+            self._pending -= 1
 
-        with ThreadPoolExecutor(max_workers=4) as ex:
-            tasks = {
-                "notes":       lambda: build_notes(client),
-                "lessons":     lambda: build_lessons(client, start_d, end_d),
-                "lessons_next7": lambda: build_lessons(client, f_start, f_end),
-                "homework_next7": lambda: build_homework(client, f_start, f_end),
+    def submit_all(self, calls: List[Tuple[Any, ...]]) -> List[Future]:
+        with self._lock:
+            if self._pending + len(calls) > self.max_workers + self.max_queue:
+                self.rejected += 1
+                EXECUTOR_REJECTED.inc()
+                raise ExecutorSaturated()
+            self._pending += len(calls)
+        futs = []
+        for fn, *args in calls:
+            fut = self._ex.submit(self._run, contextvars.copy_context(), fn, args)
+            fut.add_done_callback(self._done)
+            futs.append(fut)
+        return futs
+
+    def submit(self, fn, *args) -> Future:
+        return self.submit_all([(fn, *args)])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "queue_max": self.max_queue,
+                "rejected": self.rejected,
             }
-            time_budget = {"notes":6.0, "lessons":6.0, "lessons_next7":4.0, "homework_next7":4.0}
-            results: Dict[str, Any] = {}
 
-            for name, fn in tasks.items():
-                t1 = time.perf_counter()
+    def shutdown(self):
+        self._ex.shutdown(wait=False, cancel_futures=True)
+
+executor = BoundedExecutor(EXECUTOR_WORKERS, EXECUTOR_QUEUE_MAX)
+
+def server_busy() -> HTTPException:
+    return HTTPException(503, "server_busy", headers={"Retry-After": str(BUSY_RETRY_AFTER_S)})
+
+def empty_section(name: str) -> Dict[str, Any]:
+    return {"periods": []} if name=="notes" else ({"lessons": []} if "lessons" in name else {"homework": []})
+
+EMPTY_HASHES = {name: content_hash(empty_section(name)) for name in SECTIONS}
+
+def timed_call(fn, token: Deadline, name: str = ""):
+    # chronométré dans le worker : la durée ne dépend pas de l'ordre d'attente des futures ;
+    # le hash du contenu (ETag, meta.hashes, flux) est calculé ici aussi, une seule fois, hors de la boucle
+    token.check()  # budget déjà consommé en file d'attente : inutile de commencer
+    with span(f"section {name}", section=name):
+        t1 = time.perf_counter()
+        res = fn(token)
+        duration = round(time.perf_counter()-t1, 3)
+    return res, duration, content_hash(res)
+
+# ---- Section cache ----
+def persist_secret(username: str, password: str, url: str = PRONOTE_URL) -> bytes:
+    # clé de chiffrement au repos : dérivée des identifiants, jamais stockée
+    msg = "\0".join(("persist", url, username, password)).encode()
+    return hmac.new(POOL_SALT, msg, hashlib.sha256).digest()
+
+class SqliteSectionStore:
+    """Sections persistées dans SQLite (WAL), chiffrées AES-GCM avec une clé propre à l'utilisateur.
+
+    La ligne est indexée par un hash de la clé de cache ; sans les identifiants de
+    l'élève, on ne peut ni retrouver ni déchiffrer ses données. Taille bornée
+    (CACHE_SQLITE_MAX_ROWS), éviction des lignes les moins récemment lues.
+    """
+
+    def __init__(self, path: str, max_rows: int, stale_s: float):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._aead = AESGCM
+        self.path = path
+        self.max_rows = max_rows
+        self.stale_s = stale_s
+        self._local = threading.local()
+        # écritures hors du chemin de requête, sérialisées (SQLite n'a qu'un écrivain)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-sqlite")
+        # lectures (SELECT + déchiffrement) hors de la boucle d'événements ; WAL : en parallèle des écritures
+        self._readers = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-sqlite-read")
+        self._puts = 0
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS sections (
+                k TEXT PRIMARY KEY, stored_at REAL NOT NULL, accessed_at REAL NOT NULL, blob BLOB NOT NULL);
+            CREATE INDEX IF NOT EXISTS sections_accessed ON sections(accessed_at);
+            CREATE TABLE IF NOT EXISTS leases (k TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _row_key(key: Tuple[str, ...]) -> str:
+        return hashlib.sha256("\0".join(key).encode()).hexdigest()
+
+    def get(self, key: Tuple[str, ...], secret: bytes, digest: bool = False) -> Future:
+        # Future de (valeur, âge en s, hash du contenu si digest sinon None) ou None
+        return self._readers.submit(self._read, key, secret, digest)
+
+    def _read(self, key: Tuple[str, ...], secret: bytes, digest: bool) -> Optional[Tuple[Any, float, Optional[str]]]:
+        k = self._row_key(key)
+        row = self._conn().execute("SELECT stored_at, blob FROM sections WHERE k = ?", (k,)).fetchone()
+        if row is None:
+            return None
+        stored_at, blob = row
+        age = time.time() - stored_at
+        if age > self.stale_s:
+            return None
+        try:
+            value = orjson.loads(zlib.decompress(self._aead(secret).decrypt(blob[:12], blob[12:], k.encode())))
+        except Exception:
+            return None  # autre clé (sel changé) ou ligne corrompue : simple miss
+        self._writer.submit(self._touch, k)
+        return value, age, content_hash(value) if digest else None
+
+    def put(self, key: Tuple[str, ...], value: Any, secret: bytes) -> Future:
+        # sérialisation, compression et chiffrement dans le thread d'écriture, pas dans l'appelant
+        return self._writer.submit(self._write, key, value, secret, time.time())
+
+    def _touch(self, k: str):
+        now = time.time()
+        # une écriture par minute au plus par ligne pour l'ordre LRU
+        self._conn().execute("UPDATE sections SET accessed_at = ? WHERE k = ? AND accessed_at < ?", (now, k, now - 60))
+
+    def _write(self, key: Tuple[str, ...], value: Any, secret: bytes, now: float):
+        k = self._row_key(key)
+        nonce = secrets.token_bytes(12)
+        blob = nonce + self._aead(secret).encrypt(nonce, zlib.compress(orjson.dumps(value), 1), k.encode())
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO sections (k, stored_at, accessed_at, blob) VALUES (?, ?, ?, ?)",
+                     (k, now, now, blob))
+        self._puts += 1
+        if self._puts % 100 == 0:
+            self._evict(conn, now)
+
+    # Baux inter-processus : passent par le thread d'écriture, donc après les écritures déjà soumises.
+    # Un bail relâché garantit que les sections du meneur sont lisibles par les autres workers.
+    def lease(self, name: str, owner: str, ttl_s: float) -> Future:
+        return self._writer.submit(self._lease, name, owner, ttl_s)
+
+    def release(self, name: str, owner: str) -> Future:
+        return self._writer.submit(self._release, name, owner)
+
+    def _lease(self, name: str, owner: str, ttl_s: float) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO leases (k, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(k) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at < ? OR leases.owner = excluded.owner",
+            (name, owner, now + ttl_s, now))
+        return cur.rowcount == 1
+
+    def _release(self, name: str, owner: str):
+        self._conn().execute("DELETE FROM leases WHERE k = ? AND owner = ?", (name, owner))
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+        conn.execute("DELETE FROM sections WHERE stored_at < ?", (now - self.stale_s,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM sections").fetchone()
+        if count > self.max_rows:
+            conn.execute("DELETE FROM sections WHERE k IN (SELECT k FROM sections ORDER BY accessed_at LIMIT ?)",
+                         (count - self.max_rows,))
+
+    def stats(self) -> Dict[str, Any]:
+        # connexions SQLite réservées aux threads du store : /ping ne doit pas en ouvrir ailleurs
+        return self._readers.submit(self._stats).result()
+
+    def _stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        (count,) = conn.execute("SELECT COUNT(*) FROM sections").fetchone()
+        (leases,) = conn.execute("SELECT COUNT(*) FROM leases WHERE expires_at >= ?", (time.time(),)).fetchone()
+        return {"path": self.path, "rows": count, "max_rows": self.max_rows, "leases": leases}
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+
+class SectionCache:
+    """Cache des sections par utilisateur (LRU, TTL propre à chaque section).
+
+    Une entrée plus vieille que son TTL reste servable comme « stale » jusqu'à
+    CACHE_STALE_S, le temps qu'un rafraîchissement en tâche de fond la remplace.
+    Avec un `store` (SQLite), la mémoire sert de premier niveau devant le disque.
+    """
+
+    def __init__(self, ttl_s: Dict[str, float], stale_s: float, max_entries: int, store=None):
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self.max_entries = max_entries
+        self.store = store
+        # (user_key, section, *plage) -> (valeur, stockée à (monotonic), hash du contenu)
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[Any, float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: Tuple[str, ...], secret: Optional[bytes] = None) -> Optional[Tuple[Any, float, bool, str]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.stale_s:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        # absente ou périmée en mémoire : un autre worker a peut-être écrit plus récent sur disque
+        if (entry is None or now - entry[1] > self.ttl_s[key[1]]) and self.store is not None and secret is not None:
+            hit = await asyncio.wrap_future(self.store.get(key, secret, digest=True))
+            now = time.monotonic()
+            if hit is not None and (entry is None or now - hit[1] > entry[1]):
+                # remonté en mémoire avec son âge réel
+                entry = (hit[0], now - hit[1], hit[2])
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        value, stored_at, digest = entry
+        age = now - stored_at
+        return value, round(age, 3), age <= self.ttl_s[key[1]], digest
+
+    def _remember(self, key: Tuple[str, ...], entry: Tuple[Any, float, str]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key: Tuple[str, ...], value: Any, secret: Optional[bytes] = None, digest: Optional[str] = None):
+        # digest déjà calculé par le worker qui a produit la valeur ; sinon calculé ici (hors boucle)
+        self._remember(key, (value, time.monotonic(), digest or content_hash(value)))
+        if self.store is not None and secret is not None:
+            self.store.put(key, value, secret)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {"entries": len(self._entries), "max_entries": self.max_entries}
+        if self.store is not None:
+            out["sqlite"] = self.store.stats()
+        return out
+
+if CACHE_SQLITE_PATH and not os.getenv("POOL_SALT", "").strip():
+    log.warning("CACHE_SQLITE_PATH sans POOL_SALT : le cache persistant ne sera pas relu après redémarrage")
+section_cache = SectionCache(
+    CACHE_TTL_S, CACHE_STALE_S, CACHE_MAX_ENTRIES,
+    store=SqliteSectionStore(CACHE_SQLITE_PATH, CACHE_SQLITE_MAX_ROWS, CACHE_STALE_S) if CACHE_SQLITE_PATH else None,
+)
+
+def parse_sections(raw) -> Tuple[str, ...]:
+    # liste JSON ou "notes,homework_next7" en query ; vide = toutes, ordre canonique conservé
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    wanted = {s.strip() for s in (raw or []) if s and s.strip()}
+    unknown = wanted - set(SECTIONS)
+    if unknown:
+        raise HTTPException(400, f"unknown_sections: {','.join(sorted(unknown))}")
+    return tuple(s for s in SECTIONS if s in wanted) or SECTIONS
+
+def section_plan(start_d: date, end_d: date, f_start: date, f_end: date,
+                 sections: Tuple[str, ...] = SECTIONS) -> Dict[str, Tuple[Tuple[str, ...], Any]]:
+    # section -> (plage servant de clé de cache, builder(client, token))
+    plan = {
+        "notes": ((), lambda client, tok: build_notes(client, tok)),
+        "lessons": ((start_d.isoformat(), end_d.isoformat()),
+                    lambda client, tok: build_lessons(client, start_d, end_d, tok)),
+        "lessons_next7": ((f_start.isoformat(), f_end.isoformat()),
+                          lambda client, tok: build_lessons(client, f_start, f_end, tok)),
+        "homework_next7": ((f_start.isoformat(), f_end.isoformat()),
+                           lambda client, tok: build_homework(client, f_start, f_end, tok)),
+    }
+    return {name: plan[name] for name in sections}
+
+CROSS_FLIGHT = section_cache.store is not None and WORKERS > 1
+
+def lease_name(keys: List[Tuple[str, ...]]) -> str:
+    # bail par compte + sections + plages : deux requêtes différentes du même élève ne s'attendent pas
+    return content_hash(sorted(keys))
+
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+def refresh_sections(user_key: str, username: str, password: str, jobs: Dict[str, Tuple[Tuple[str, ...], Any]]):
+    owner = secrets.token_hex(8)
+    lease = lease_name([(user_key, name, *rng) for name, (rng, _) in jobs.items()])
+    try:
+        # un autre worker rafraîchit déjà ces sections : on lui laisse la place
+        if CROSS_FLIGHT and not section_cache.store.lease(lease, owner, CROSS_FLIGHT_LEASE_S).result():
+            return
+        client = session_pool.get(user_key, username, password)
+        secret = persist_secret(username, password) if section_cache.store else None
+        for name, (rng, fn) in jobs.items():
+            try:
+                section_cache.put((user_key, name, *rng), fn(client, Deadline(TIME_BUDGET[name])), secret)
+            except Exception:
+                pass  # l'entrée stale reste servie, prochain essai à la prochaine requête
+    except HTTPException:
+        pass  # limiteur saturé ou disjoncteur ouvert : la session n'y est pour rien
+    except Exception:
+        session_pool.discard(user_key)
+    finally:
+        if CROSS_FLIGHT:
+            section_cache.store.release(lease, owner)
+        with _refreshing_lock:
+            _refreshing.difference_update((user_key, name, *rng) for name, (rng, _) in jobs.items())
+
+def claim_refresh(user_key: str, jobs: Dict[str, Tuple[Tuple[str, ...], Any]]) -> Dict[str, Tuple[Tuple[str, ...], Any]]:
+    # un seul rafraîchissement en vol par entrée de cache ; libéré par refresh_sections
+    with _refreshing_lock:
+        jobs = {n: j for n, j in jobs.items() if (user_key, n, *j[0]) not in _refreshing}
+        _refreshing.update((user_key, n, *j[0]) for n, j in jobs.items())
+    return jobs
+
+def schedule_refresh(user_key: str, username: str, password: str, jobs: Dict[str, Tuple[Tuple[str, ...], Any]]):
+    # serveur ou ENT en panne : l'entrée stale reste servie, les sondes viennent des vraies requêtes
+    if login_retry_after():
+        return
+    jobs = claim_refresh(user_key, jobs)
+    if not jobs:
+        return
+    try:
+        executor.submit(refresh_sections, user_key, username, password, jobs)
+    except ExecutorSaturated:
+        with _refreshing_lock:
+            _refreshing.difference_update((user_key, n, *j[0]) for n, j in jobs.items())
+
+# ---- Single-flight ----
+class SingleFlight:
+    """Déduplique les appels identiques concurrents : un seul calcul, résultat partagé.
+
+    Vit sur la boucle asyncio : pas de verrou, les suiveurs attendent la future du meneur.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Any, asyncio.Future] = {}
+
+    async def do(self, key, coro_fn):
+        fut = self._calls.get(key)
+        if fut is not None:
+            res = await asyncio.shield(fut)
+            return {**res, "meta": {**res["meta"], "coalesced": True}}
+        fut = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            res = await coro_fn()
+            fut.set_result(res)
+            return res
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()  # marquée comme lue : pas d'avertissement s'il n'y a aucun suiveur
+            raise
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._calls)}
+
+single_flight = SingleFlight()
+
+# ---- Metrics (Prometheus) ----
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 4, 6, 8, 12, 20, 30)
+LOGIN_SECONDS = Histogram("pronote_login_seconds", "Obtention d'un client connecté (pool ou login)", buckets=LATENCY_BUCKETS)
+LOGIN_PHASE_SECONDS = Histogram("pronote_login_phase_seconds", "Phases du login : ent, session_setup, session_check",
+                                ["phase"], buckets=LATENCY_BUCKETS)
+SECTION_SECONDS = Histogram("pronote_section_seconds", "Durée d'une section récupérée en amont", ["section"], buckets=LATENCY_BUCKETS)
+SECTION_STATUS = Counter("pronote_section_status", "Statut final des sections (fresh/cached/stale = ok)", ["section", "status"])
+SERIALIZE_SECONDS = Histogram("pronote_serialize_seconds", "Sérialisation de la réponse",
+                              buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+FETCH_SECONDS = Histogram("pronote_fetch_seconds", "Durée totale de /pronote/fetch, erreurs comprises",
+                          ["mode", "status"], buckets=LATENCY_BUCKETS)
+
+Gauge("pronote_pool_sessions", "Clients connectés dans le pool").set_function(lambda: session_pool.stats()["size"])
+Gauge("pronote_executor_active", "Workers occupés").set_function(lambda: executor.stats()["active"])
+Gauge("pronote_executor_queued", "Tâches en file d'attente").set_function(lambda: executor.stats()["queued"])
+EXECUTOR_REJECTED = Counter("pronote_executor_rejected", "Soumissions refusées (503) par l'executor")
+Gauge("pronote_cache_entries", "Entrées du cache de sections").set_function(lambda: len(section_cache))
+Gauge("pronote_inflight_fetches", "Fetch en cours partagés par single-flight").set_function(lambda: single_flight.stats()["in_flight"])
+UPSTREAM_WAIT_SECONDS = Histogram("pronote_upstream_wait_seconds", "Attente devant le limiteur en amont",
+                                  ["kind", "key"], buckets=(0.001, 0.005, 0.01, 0.025) + LATENCY_BUCKETS)
+CIRCUIT_STATE = Gauge("pronote_circuit_state", "État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert)", ["kind", "key"])
+CIRCUIT_REJECTED = Counter("pronote_circuit_rejected", "Appels refusés par un disjoncteur ouvert", ["kind", "key"])
+UPSTREAM_THROTTLED = Counter("pronote_upstream_throttled", "Appels abandonnés faute de place dans le limiteur", ["kind", "key"])
+PREWARM_USERS = Counter("pronote_prewarm_users", "Utilisateurs traités par le préchauffage", ["result"])
+Gauge("pronote_prewarm_active_users", "Utilisateurs suivis pour le préchauffage").set_function(lambda: len(active_users))
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+# ---- Profiling ----
+# piles « au repos » (worker en attente de tâche, boucle asyncio sans travail) : ignorées
+IDLE_FRAMES = {("threading.py", "wait"), ("queue.py", "get"), ("selectors.py", "select"), ("thread.py", "_worker")}
+
+class SamplingProfiler:
+    """Échantillonne les piles de tous les threads (sys._current_frames) depuis un thread dédié.
+
+    L'échantillonnage est global au process : le profil d'une requête contient
+    aussi ce que faisaient les requêtes concurrentes pendant sa fenêtre.
+    """
+
+    def __init__(self, interval_s: float, max_samples: int):
+        self.interval_s = interval_s
+        self.samples: deque = deque(maxlen=max_samples)  # (perf_counter, pile racine -> feuille)
+        self._labels: Dict[Any, str] = {}
+        self._users = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            self._users += 1
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._users = max(0, self._users - 1)
+            if self._users == 0 and self._thread is not None:
+                self._stop.set()
+                self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _loop(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                self.samples.append((now, tuple(reversed(stack))))
+
+    def window(self, t_start: float, t_end: float) -> List[Tuple[str, ...]]:
+        # list(deque) se fait en C sans relâcher le GIL : copie cohérente malgré le thread d'échantillonnage
+        return [stack for t, stack in list(self.samples) if t_start <= t <= t_end]
+
+def summarize_profile(stacks: "Tally[Tuple[str, ...]]", top: int = 40) -> Dict[str, Any]:
+    # self = fonction en haut de pile ; total = fonction présente dans la pile
+    self_t, total_t = Tally(), Tally()
+    for stack, n in stacks.items():
+        self_t[stack[-1]] += n
+        for fn in set(stack):
+            total_t[fn] += n
+    return {
+        "samples": sum(stacks.values()),
+        "interval_s": profiler.interval_s,
+        "top_self": [{"frame": f, "samples": n} for f, n in self_t.most_common(top)],
+        "top_total": [{"frame": f, "samples": n} for f, n in total_t.most_common(top)],
+        # format « collapsed stacks » : flamegraph.pl / speedscope
+        "collapsed": "\n".join(f"{';'.join(st)} {n}" for st, n in stacks.most_common()),
+    }
+
+profiler = SamplingProfiler(PROFILE_INTERVAL_S, PROFILE_MAX_SAMPLES)
+profile_session: Dict[str, Any] = {}  # profil à la demande : requests restantes + piles agrégées
+slow_profiles: deque = deque(maxlen=PROFILE_SLOW_KEEP)
+# extraction des fenêtres (jusqu'à PROFILE_MAX_SAMPLES piles) et résumés hors de la boucle d'événements ;
+# un seul thread : les piles agrégées ne sont jamais lues pendant qu'on les met à jour
+profile_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile")
+
+def profile_request(t_start: float, label: str):
+    """Appelé en fin de /pronote/fetch : alimente le profil à la demande et capture les requêtes lentes."""
+    if not profiler.running:
+        return
+    t_end = time.perf_counter()
+    if profile_session.get("remaining", 0) > 0:
+        stacks = profile_session["stacks"]
+        profile_worker.submit(lambda: stacks.update(profiler.window(t_start, t_end)))
+        profile_session["requests"] += 1
+        profile_session["remaining"] -= 1
+        if profile_session["remaining"] == 0:
+            profile_session["finished_at"] = datetime.now().isoformat(timespec="seconds")
+            profiler.stop()
+    if PROFILE_SLOW_S and t_end - t_start >= PROFILE_SLOW_S:
+        # piles brutes seulement ; résumé calculé à la lecture (GET /admin/profile/slow)
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "request": label,
+            "duration_s": round(t_end - t_start, 3),
+            "stacks": Tally(),
+        }
+        slow_profiles.append(entry)
+        profile_worker.submit(lambda: entry["stacks"].update(profiler.window(t_start, t_end)))
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin_key)])
+def admin_profile_start(requests: int = 10):
+    if profile_session.get("remaining", 0) > 0:
+        raise HTTPException(409, "profile_in_progress")
+    profile_session.clear()
+    profile_session.update(remaining=max(1, requests), requests=0, stacks=Tally(),
+                           started_at=datetime.now().isoformat(timespec="seconds"))
+    profiler.start()
+    return {"ok": True, "requests": profile_session["remaining"]}
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin_key)])
+def admin_profile_result():
+    if not profile_session:
+        raise HTTPException(404, "no_profile")
+    return {
+        "done": profile_session["remaining"] == 0,
+        "requests": profile_session["requests"],
+        "remaining": profile_session["remaining"],
+        "started_at": profile_session["started_at"],
+        "finished_at": profile_session.get("finished_at"),
+        **profile_worker.submit(summarize_profile, profile_session["stacks"]).result(),
+    }
+
+@app.get("/admin/profile/slow", dependencies=[Depends(require_admin_key)])
+def admin_profile_slow():
+    def summarize():
+        return [{**{k: v for k, v in p.items() if k != "stacks"}, "profile": summarize_profile(p["stacks"])}
+                for p in list(slow_profiles)]
+    return {"threshold_s": PROFILE_SLOW_S, "profiles": profile_worker.submit(summarize).result()}
+
+# ---- Préchauffage ----
+class ActiveUsers:
+    """Utilisateurs vus récemment, avec leurs identifiants (en mémoire seulement, LRU borné).
+
+    Vit sur la boucle asyncio comme SingleFlight : pas de verrou.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        # user_key -> (username, password, vu à (time.time))
+        self._users: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+
+    def touch(self, user_key: str, username: str, password: str):
+        self._users[user_key] = (username, password, time.time())
+        self._users.move_to_end(user_key)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def recent(self, max_age_s: float) -> List[Tuple[str, str, str]]:
+        since = time.time() - max_age_s
+        return [(k, u, p) for k, (u, p, seen) in self._users.items() if seen >= since]
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+def parse_windows(spec: str) -> List[Tuple[dtime, dtime]]:
+    out = []
+    for part in filter(None, (x.strip() for x in spec.split(","))):
+        start, _, end = part.partition("-")
+        out.append((dtime.fromisoformat(start.strip()), dtime.fromisoformat(end.strip())))
+    return out
+
+class Prewarmer:
+    """Vagues de rafraîchissement avant les pics, pour servir ceux-ci depuis un cache chaud.
+
+    Chaque vague démarre PREWARM_LEAD_S avant le début d'un pic ; chaque utilisateur actif
+    reçoit un délai aléatoire dans cette fenêtre. Un sémaphore global borne les appels en
+    amont et une vague cède la place dès que l'executor a du travail en file.
+    """
+
+    def __init__(self, windows: List[Tuple[dtime, dtime]], lead_s: float, concurrency: int):
+        self.windows = windows
+        self.lead_s = lead_s
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+        self._last_peak: Optional[datetime] = None
+        self.last_wave: Optional[Dict[str, Any]] = None
+
+    def next_peak(self, after: datetime) -> Optional[datetime]:
+        starts = [datetime.combine(after.date() + timedelta(days=d), w[0]) for d in (0, 1) for w in self.windows]
+        return min((s for s in starts if s > after), default=None)
+
+    def start(self):
+        if self.windows:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            now = datetime.now()
+            # une vague par pic ; démarrée en pleine fenêtre d'avance, elle s'étale sur ce qui reste
+            peak = self.next_peak(max(now, self._last_peak or now))
+            await asyncio.sleep(max(0.0, (peak - now).total_seconds() - self.lead_s))
+            self._last_peak = peak
+            try:
+                await self.wave(peak)
+            except Exception as e:
+                log.warning("prewarm: vague %s interrompue (%s)", f"{peak:%H:%M}", type(e).__name__)
+
+    async def wave(self, peak: datetime):
+        users = active_users.recent(PREWARM_ACTIVE_S)
+        spread = max(0.0, (peak - datetime.now()).total_seconds())
+        sem = asyncio.Semaphore(self.concurrency)
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*[
+            self.warm(sem, random.uniform(0, spread), peak, *user) for user in users
+        ], return_exceptions=True)
+        tally = Tally(r if isinstance(r, str) else "error" for r in results)
+        self.last_wave = {"peak": peak.isoformat(timespec="minutes"), "users": len(users),
+                          "results": dict(tally), "duration_s": round(time.perf_counter() - t0, 3)}
+
+    async def warm(self, sem: asyncio.Semaphore, delay: float, peak: datetime,
+                   user_key: str, username: str, password: str) -> str:
+        await asyncio.sleep(delay)
+        async with sem:
+            # priorité au trafic réel : on attend que la file de l'executor soit vide
+            while executor.stats()["queued"] or not executor.has_capacity(1):
+                await asyncio.sleep(1.0)
+            if login_retry_after():
+                PREWARM_USERS.labels("circuit_open").inc()
+                return "circuit_open"
+            today = date.today()
+            until_peak = max(0.0, (peak - datetime.now()).total_seconds())
+            secret = persist_secret(username, password) if section_cache.store else None
+            jobs = {}
+            for name, job in section_plan(today, today, today, today + timedelta(days=7), PREWARM_SECTIONS).items():
+                hit = await section_cache.get((user_key, name, *job[0]), secret)
+                # encore frais au début du pic : rien à faire
+                if hit is None or hit[1] + until_peak > CACHE_TTL_S[name]:
+                    jobs[name] = job
+            if not jobs:
+                result = "fresh"
+            elif not (jobs := claim_refresh(user_key, jobs)):
+                result = "in_flight"
+            else:
+                result = "refreshed"
                 try:
-                    results[name] = with_timeout(ex, fn, time_budget[name])
-                    status[name] = "ok"
-                except FuturesTimeout:
-                    status[name] = "timeout"
-                    errors[name] = f"timeout>{time_budget[name]}s"
-                    results[name] = {"periods": []} if name=="notes" else ({"lessons": []} if "lessons" in name else {"homework": []})
-                except Exception as e:
-                    status[name] = "error"
-                    errors[name] = f"{type(e).__name__}: {e}"
-                    results[name] = {"periods": []} if name=="notes" else ({"lessons": []} if "lessons" in name else {"homework": []})
-                finally:
-                    timing[name] = round(time.perf_counter()-t1, 3)
-
-        timing["total_s"] = round(time.perf_counter()-t0, 3)
+                    await asyncio.wrap_future(executor.submit(refresh_sections, user_key, username, password, jobs))
+                except ExecutorSaturated:
+                    with _refreshing_lock:
+                        _refreshing.difference_update((user_key, n, *j[0]) for n, j in jobs.items())
+                    result = "busy"
+            PREWARM_USERS.labels(result).inc()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        peak = self.next_peak(datetime.now())
+        return {"enabled": self._task is not None, "active_users": len(active_users),
+                "next_peak": peak.isoformat(timespec="minutes") if peak else None, "last_wave": self.last_wave}
+
+active_users = ActiveUsers(PREWARM_MAX_USERS)
+prewarm = Prewarmer(parse_windows(PREWARM_WINDOWS), PREWARM_LEAD_S, PREWARM_CONCURRENCY)
+
+# ---- Fetch ----
+class FetchJob:
+    """Un fetch REAL : identité, plages, sections demandées et méta accumulée au fil de l'eau."""
 
+    def __init__(self, user_key: str, username: str, password: str,
+                 start_d: date, end_d: date, f_start: date, f_end: date,
+                 sections: Tuple[str, ...], t0: float):
+        self.user_key = user_key
+        self.username = username
+        self.password = password
+        self.start_d, self.end_d = start_d, end_d
+        self.f_start, self.f_end = f_start, f_end
+        self.t0 = t0
+        self.plan = section_plan(start_d, end_d, f_start, f_end, sections)
+        self.secret = persist_secret(username, password) if section_cache.store else None
+        self.status: Dict[str,str] = {}
+        self.timing: Dict[str,Any] = {}
+        self.errors: Dict[str,str] = {}
+        self.ages: Dict[str,float] = {}
+        self.hashes: Dict[str,str] = {}
+        self.session: Optional[str] = None
+
+    def record_login(self, phases: Dict[str, Any], total_s: float):
+        # login_s = attente totale (file executor comprise) ; le reste = phases mesurées dans le pool
+        self.session = phases.pop("session", None)
+        self.add_upstream_wait("login", phases.pop("upstream_wait_s", 0.0))
+        self.timing["login_s"] = round(total_s, 3)
+        LOGIN_SECONDS.observe(total_s)
+        for phase, secs in phases.items():
+            self.timing[phase] = secs
+            LOGIN_PHASE_SECONDS.labels(phase.removesuffix("_s")).observe(secs)
+
+    def add_upstream_wait(self, phase: str, waited_s: float):
+        # attente devant les limiteurs par phase (login, chaque section), incluse dans sa durée ;
+        # pas de total : les sections attendent en parallèle, une somme dépasserait le temps réel
+        waited_s = round(waited_s, 3)
+        if waited_s:
+            self.timing.setdefault("upstream_wait_s", {})[phase] = waited_s
+
+    def meta(self) -> Dict[str, Any]:
+        self.timing["total_s"] = round(time.perf_counter()-self.t0, 3)
+        for name, st in self.status.items():
+            SECTION_STATUS.labels(name, st).inc()
         return {
-            "notes": results["notes"],
-            "lessons": results["lessons"],
-            "lessons_next7": results["lessons_next7"],
-            "homework_next7": results["homework_next7"],
-            "meta": {
-                "school_url": PRONOTE_URL,
-                "range_past": {"start": start_d.isoformat(), "end": end_d.isoformat()},
-                "range_next7": {"start": f_start.isoformat(), "end": f_end.isoformat()},
-                "status": status,
-                "errors": errors,
-                "timing": timing,
-                "include_content": INCLUDE_CONTENT
-            }
+            "school_url": PRONOTE_URL,
+            "range_past": {"start": self.start_d.isoformat(), "end": self.end_d.isoformat()},
+            "range_next7": {"start": self.f_start.isoformat(), "end": self.f_end.isoformat()},
+            "status": self.status,
+            "errors": self.errors,
+            "cache_age_s": self.ages,
+            "session": self.session,
+            "timing": self.timing,
+            "include_content": INCLUDE_CONTENT,
+            "hashes": {name: self.hashes[name] for name in self.plan if name in self.hashes},
         }
 
+async def await_section(job: FetchJob, name: str, fut: Future, token: Deadline, t1: float) -> Tuple[str, Any]:
+    budget = min(TIME_BUDGET[name], FETCH_DEADLINE_S)
+    try:
+        data, job.timing[name], job.hashes[name] = await asyncio.wait_for(
+            asyncio.wrap_future(fut), timeout=max(0.0, token.remaining()))
+        job.status[name] = "fresh"
+        job.ages[name] = 0.0
+        SECTION_SECONDS.labels(name).observe(job.timing[name])
+        section_cache.put((job.user_key, name, *job.plan[name][0]), data, job.secret, job.hashes[name])
+        return name, data
+    except (asyncio.TimeoutError, FuturesTimeout, SectionCancelled):
+        # on détache la future : retirée de la file si pas démarrée,
+        # sinon le worker s'arrête au prochain point de contrôle
+        token.cancel()
+        fut.cancel()
+        job.status[name] = "timeout"
+        job.errors[name] = f"timeout>{budget}s"
+        SECTION_SECONDS.labels(name).observe(time.perf_counter()-t1)
+    except CircuitOpen:
+        job.status[name] = "unavailable"
+        job.errors[name] = "circuit_open"
+    except Exception as e:
+        job.status[name] = "error"
+        job.errors[name] = f"{type(e).__name__}: {e}"
+    finally:
+        job.add_upstream_wait(name, token.waited_s)
+    job.timing[name] = round(time.perf_counter()-t1, 3)
+    job.hashes[name] = EMPTY_HASHES[name]
+    return name, empty_section(name)
+
+async def iter_sections(job: FetchJob):
+    """Produit (section, données) dans l'ordre où elles deviennent disponibles."""
+    # cache d'abord : frais -> "cached", périmé -> "stale" servi tout de suite puis rafraîchi en fond
+    to_fetch, to_refresh = [], {}
+    for name, (rng, fn) in job.plan.items():
+        hit = await section_cache.get((job.user_key, name, *rng), job.secret)
+        if hit is None:
+            to_fetch.append(name)
+            continue
+        data, job.ages[name], fresh, job.hashes[name] = hit
+        job.status[name] = "cached" if fresh else "stale"
+        if not fresh:
+            to_refresh[name] = (rng, fn)
+        yield name, data
+    # un hit prouve des identifiants valides (la clé en dérive) ; sinon, suivi après le login
+    if PREWARM_ENABLED and job.status:
+        active_users.touch(job.user_key, job.username, job.password)
+
+    owner = lease = None
+    if to_fetch and CROSS_FLIGHT:
+        owner = secrets.token_hex(8)
+        lease = lease_name([(job.user_key, name, *job.plan[name][0]) for name in to_fetch])
+        async for name, data in await_peer(job, to_fetch, lease, owner):
+            yield name, data
+    try:
+        async for name, data in fetch_sections(job, to_fetch):
+            yield name, data
+    finally:
+        if owner is not None:
+            section_cache.store.release(lease, owner)
+
+    if to_refresh:
+        schedule_refresh(job.user_key, job.username, job.password, to_refresh)
+
+async def await_peer(job: FetchJob, to_fetch: List[str], lease: str, owner: str):
+    """Prend le bail de ces sections ; s'il est tenu par un autre worker, sert ses sections au fil de l'eau.
+
+    Retire de `to_fetch` ce que le meneur a écrit. Au bail obtenu (meneur fini ou expiré) ou
+    après CROSS_FLIGHT_WAIT_S, le reste est récupéré par l'appelant.
+    """
+    t_wait = time.perf_counter()
+    give_up = time.monotonic() + CROSS_FLIGHT_WAIT_S
+    polled = False
+    while True:
+        acquired = await asyncio.wrap_future(section_cache.store.lease(lease, owner, CROSS_FLIGHT_LEASE_S))
+        if polled:
+            # relu aussi après obtention du bail : le meneur vient peut-être de finir
+            for name in list(to_fetch):
+                hit = await section_cache.get((job.user_key, name, *job.plan[name][0]), job.secret)
+                if hit is not None and hit[2]:
+                    to_fetch.remove(name)
+                    data, job.ages[name], _, job.hashes[name] = hit
+                    job.status[name] = "cached"
+                    yield name, data
+            job.timing["peer_wait_s"] = round(time.perf_counter() - t_wait, 3)
+        if acquired or not to_fetch or time.monotonic() > give_up:
+            return
+        polled = True
+        await asyncio.sleep(CROSS_FLIGHT_POLL_S)
+
+async def login_job(job: FetchJob, n_sections: int):
+    retry_after = login_retry_after()
+    if retry_after:
+        # serveur ou ENT en panne : réponse immédiate plutôt qu'un login qui attendrait son timeout
+        raise upstream_unavailable(retry_after)
+    # refus rapide avant même le login si l'executor est plein
+    if not executor.has_capacity(n_sections + 1):
+        raise server_busy()
+    try:
+        # seuls les appels pronotepy bloquants quittent la boucle d'événements
+        t_login = time.perf_counter()
+        phases: Dict[str, Any] = {}
+        try:
+            client = await asyncio.wrap_future(
+                executor.submit(session_pool.get, job.user_key, job.username, job.password, phases))
+        finally:
+            job.record_login(phases, time.perf_counter()-t_login)
+    except ExecutorSaturated:
+        raise server_busy()
     except HTTPException:
         raise
     except Exception as e:
+        # session potentiellement cassée : on ne la garde pas pour le prochain appel
+        session_pool.discard(job.user_key)
         raise HTTPException(502, f"connexion_pronote_failed: {type(e).__name__}")
+    if PREWARM_ENABLED:
+        active_users.touch(job.user_key, job.username, job.password)
+    return client
+
+async def fetch_sections(job: FetchJob, to_fetch: List[str]):
+    if to_fetch:
+        try:
+            client = await login_job(job, len(to_fetch))
+        except HTTPException as e:
+            # login impossible (502/503) : avec du cache déjà servi, le reste est marqué
+            # indisponible plutôt que de tout jeter ; sans rien à servir, l'erreur remonte
+            if e.status_code not in (502, 503) or not job.status:
+                raise
+            reason = "circuit_open" if e.detail == "upstream_unavailable" else e.detail
+            for name in to_fetch:
+                job.status[name] = "unavailable"
+                job.errors[name] = reason
+                job.hashes[name] = EMPTY_HASHES[name]
+                yield name, empty_section(name)
+            return
+
+        # tout est soumis d'un coup : la durée totale devient le max des sections, pas la somme
+        t1 = time.perf_counter()
+        tokens = {name: Deadline(min(TIME_BUDGET[name], FETCH_DEADLINE_S)) for name in to_fetch}
+        try:
+            futs = executor.submit_all([
+                (timed_call, lambda tok, fn=job.plan[name][1]: fn(client, tok), tokens[name], name) for name in to_fetch
+            ])
+        except ExecutorSaturated:
+            raise server_busy()
+        for done in asyncio.as_completed([
+            await_section(job, name, fut, tokens[name], t1) for name, fut in zip(to_fetch, futs)
+        ]):
+            yield await done
+
+async def fetch_real(job: FetchJob) -> Dict[str, Any]:
+    results = {name: data async for name, data in iter_sections(job)}
+    return {**{name: results[name] for name in job.plan}, "meta": job.meta()}
+
+def resolve_ranges(payload: FetchPayload) -> Tuple[date, date, date, date]:
+    # Plages
+    if payload.start and payload.end:
+        start_d = datetime.fromisoformat(payload.start).date()
+        end_d   = datetime.fromisoformat(payload.end).date()
+    else:
+        end_d = date.today()
+        start_d = end_d - timedelta(days=max(1, payload.days))
+    f_start = date.today()
+    f_end   = f_start + timedelta(days=7)
+    return start_d, end_d, f_start, f_end
+
+# ---- Streaming (NDJSON / SSE) ----
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def stream_format(stream: Optional[str], accept: Optional[str]) -> Optional[str]:
+    if stream:
+        if stream not in STREAM_MEDIA_TYPES:
+            raise HTTPException(400, f"unknown_stream_format: {stream}")
+        return stream
+    for fmt, media_type in STREAM_MEDIA_TYPES.items():
+        if accept and media_type in accept:
+            return fmt
+    return None
+
+def encode_event(fmt: str, name: str, body: Dict[str, Any]) -> bytes:
+    if fmt == "sse":
+        return b"event: " + name.encode() + b"\ndata: " + orjson.dumps(body) + b"\n\n"
+    return orjson.dumps({"section": name, **body}) + b"\n"
+
+async def stream_response(fmt: str, sections, status: Dict[str, str], hashes: Dict[str, str], meta_fn) -> StreamingResponse:
+    # premier élément attendu avant d'ouvrir le flux : 400/401/502/503 immédiats gardent leur code HTTP
+    try:
+        first = await sections.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def body():
+        try:
+            if first is not None:
+                yield encode_event(fmt, first[0], {"status": status[first[0]], "hash": hashes[first[0]], "data": first[1]})
+            async for name, data in sections:
+                yield encode_event(fmt, name, {"status": status[name], "hash": hashes[name], "data": data})
+        except HTTPException as e:
+            # en plein flux le code HTTP est déjà parti : l'erreur devient un évènement
+            yield encode_event(fmt, "error", {"status_code": e.status_code, "detail": e.detail})
+        yield encode_event(fmt, "meta", {"data": meta_fn()})
+
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[fmt],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def iter_mock(source: Dict[str, Any]):
+    for name, data in source.items():
+        yield name, data
+
+_synthetic_client = None
+
+def build_synthetic(plan: Dict[str, Tuple[Tuple[str, ...], Any]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    global _synthetic_client
+    if _synthetic_client is None:
+        from fake_pronote import SyntheticData
+        _synthetic_client = SyntheticData.from_env()
+    source = {name: fn(_synthetic_client, None) for name, (_, fn) in plan.items()}
+    return source, {name: content_hash(data) for name, data in source.items()}
+
+@app.post("/pronote/fetch")
+async def pronote_fetch(payload: FetchPayload, sections: Optional[str] = None,
+                        stream: Optional[str] = None, accept: Optional[str] = Header(None),
+                        if_none_match: Optional[str] = Header(None)):
+    t0 = time.perf_counter()
+    # mesurée et profilée sur tous les chemins (erreurs, 304, MOCK compris) : les plus lentes sont souvent
+    # des échecs ; un flux est compté à sa fin, dans stream_meta
+    label, mode, status, finished_by_stream = "fetch", "buffered", 200, False
+    try:
+        # ?sections=... prime sur le champ du body
+        wanted = parse_sections(sections if sections is not None else payload.sections)
+        # ?stream=ndjson|sse ou Accept: application/x-ndjson|text/event-stream
+        fmt = stream_format(stream, accept)
+        start_d, end_d, f_start, f_end = resolve_ranges(payload)
+
+        if MOCK:
+            label, mode = f"mock {','.join(wanted)}", "mock"
+            def mock_meta():
+                return {
+                    "school_url": "MOCK",
+                    "range_past": {"start": start_d.isoformat(), "end": end_d.isoformat()},
+                    "range_next7": {"start": f_start.isoformat(), "end": f_end.isoformat()},
+                    "status": {name: "fresh" for name in wanted},
+                    "timing": {"total_s": round(time.perf_counter()-t0, 3)}
+                }
+            source, hashes = await mock_source(section_plan(start_d, end_d, f_start, f_end, wanted))
+            if fmt:
+                return await stream_response(fmt, iter_mock(source), {name: "fresh" for name in wanted}, hashes, mock_meta)
+            etag = etag_for(hashes, start_d, end_d, f_start, f_end)
+            if etag_matches(if_none_match, etag):
+                status = 304
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+            if MOCK_SYNTHETIC:
+                return ORJSONResponse({**source, "meta": {**mock_meta(), "hashes": hashes}},
+                                      headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+            return Response(mock_body_prefix(wanted) + b'"meta":' + orjson.dumps({**mock_meta(), "hashes": hashes}) + b"}",
+                            media_type="application/json", headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+        # --- REAL ---
+        label = f"fetch {','.join(wanted)}"
+        user_key = credential_key(payload.username, payload.password)
+        job = FetchJob(user_key, payload.username, payload.password, start_d, end_d, f_start, f_end, wanted, t0)
+        if fmt:
+            mode = "stream"
+            def stream_meta():
+                meta = job.meta()
+                FETCH_SECONDS.labels("stream", "200").observe(time.perf_counter()-t0)
+                profile_request(t0, f"stream {','.join(wanted)}")
+                return meta
+            resp = await stream_response(fmt, iter_sections(job), job.status, job.hashes, stream_meta)
+            finished_by_stream = True
+            return resp
+        # requêtes identiques simultanées (rechargement d'onglet + refresh mobile) : un seul scrape
+        flight_key = (user_key, start_d, end_d, f_start, f_end, wanted)
+        with span("pronote.fetch", sections=",".join(wanted)):
+            body = await single_flight.do(flight_key, lambda: fetch_real(job))
+        # ETag sur le contenu des sections uniquement : 304 si le client a déjà exactement ces données ;
+        # hashes calculés une fois à la production ou à la mise en cache de chaque section
+        etag = etag_for(body["meta"]["hashes"], start_d, end_d, f_start, f_end)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(if_none_match, etag):
+            status = 304
+            return Response(status_code=304, headers=headers)
+        # Response renvoyée telle quelle : FastAPI saute jsonable_encoder, orjson sérialise directement
+        t_ser = time.perf_counter()
+        resp = ORJSONResponse(body, headers=headers)
+        SERIALIZE_SECONDS.observe(time.perf_counter()-t_ser)
+        return resp
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except Exception:
+        status = 500
+        raise
+    finally:
+        if not finished_by_stream:
+            FETCH_SECONDS.labels(mode, str(status)).observe(time.perf_counter()-t0)
+            profile_request(t0, label)
+
+# ---- Sync incrémentale ----
+def sync_id(key: str) -> str:
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+def section_items(name: str, data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Éléments d'une section indexés par un id stable (indépendant des champs qui peuvent changer)."""
+    if name == "notes":
+        rows = ((f"{p['name']}|{g['date']}|{g['subjectId']}|{g.get('outOf')}|{g.get('coefficient')}", {"period": p["name"], **g})
+                for p in data["periods"] for g in p["grades"])
+    elif name.startswith("lessons"):
+        rows = ((f"{c['date']}|{c['start']}|{c['end']}|{c['subjectId']}", c) for c in data["lessons"])
+    else:
+        rows = ((h["id"], h) for h in data["homework"])
+    items: Dict[str, Dict[str, Any]] = {}
+    for base, item in rows:
+        sid, n = sync_id(base), 1
+        # doublons exacts (deux notes le même jour dans la même matière) : suffixe d'occurrence
+        while sid in items:
+            n += 1
+            sid = sync_id(f"{base}#{n}")
+        items[sid] = item
+    return items
+
+class ManifestStore:
+    """Derniers manifestes envoyés par utilisateur : version -> {section: {syncId: hash}}.
+
+    Avec un `store` (SQLite partagé), les manifestes y sont aussi écrits, chiffrés comme les
+    sections : un curseur émis par un worker est reconnu par les autres.
+    """
+
+    def __init__(self, max_entries: int, store=None):
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, user_key: str, version: str, manifest: Dict[str, Dict[str, str]]):
+        with self._lock:
+            self._entries[(user_key, version)] = manifest
+            self._entries.move_to_end((user_key, version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get(self, user_key: str, version: str, secret: Optional[bytes] = None) -> Optional[Dict[str, Dict[str, str]]]:
+        with self._lock:
+            manifest = self._entries.get((user_key, version))
+            if manifest is not None:
+                self._entries.move_to_end((user_key, version))
+                return manifest
+        if self.store is None or secret is None:
+            return None
+        hit = await asyncio.wrap_future(self.store.get((user_key, "manifest", version), secret))
+        if hit is None:
+            return None
+        self._remember(user_key, version, hit[0])
+        return hit[0]
+
+    async def put(self, user_key: str, version: str, manifest: Dict[str, Dict[str, str]], secret: Optional[bytes] = None):
+        self._remember(user_key, version, manifest)
+        if self.store is not None and secret is not None:
+            # écrit avant de rendre le curseur : la prochaine requête peut tomber sur un autre worker
+            await asyncio.wrap_future(self.store.put((user_key, "manifest", version), manifest, secret))
+
+manifest_store = ManifestStore(SYNC_MAX_MANIFESTS, store=section_cache.store)
+
+async def mock_source(plan: Dict[str, Tuple[Tuple[str, ...], Any]]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    # (sections, hashes) : hashes précalculés (MOCK) ou calculés dans le worker (synthétique)
+    if MOCK_SYNTHETIC:
+        # même admission que le chemin REAL : executor plein -> 503, pas 500
+        try:
+            fut = executor.submit(build_synthetic, plan)
+        except ExecutorSaturated:
+            raise server_busy()
+        return await asyncio.wrap_future(fut)
+    return {name: MOCK_SECTIONS[name] for name in plan}, {name: MOCK_HASHES[name] for name in plan}
+
+@app.post("/pronote/sync")
+async def pronote_sync(payload: SyncPayload, sections: Optional[str] = None):
+    """Comme /pronote/fetch, mais ne renvoie que les éléments ajoutés/modifiés/supprimés depuis `cursor`."""
+    t0 = time.perf_counter()
+    wanted = parse_sections(sections if sections is not None else payload.sections)
+    start_d, end_d, f_start, f_end = resolve_ranges(payload)
+    user_key = credential_key(payload.username, payload.password)
+
+    if MOCK:
+        source, _ = await mock_source(section_plan(start_d, end_d, f_start, f_end, wanted))
+        body = {**source, "meta": {"school_url": "MOCK", "status": {name: "fresh" for name in wanted}, "timing": {}}}
+    else:
+        job = FetchJob(user_key, payload.username, payload.password, start_d, end_d, f_start, f_end, wanted, t0)
+        flight_key = (user_key, start_d, end_d, f_start, f_end, wanted)
+        body = await single_flight.do(flight_key, lambda: fetch_real(job))
+    meta = body["meta"]
+
+    secret = persist_secret(payload.username, payload.password) if manifest_store.store else None
+    previous = await manifest_store.get(user_key, payload.cursor, secret) if payload.cursor else None
+    manifest: Dict[str, Dict[str, str]] = {}
+    changes: Dict[str, Dict[str, Any]] = {}
+    for name in wanted:
+        old = (previous or {}).get(name, {})
+        if meta["status"].get(name) in {"timeout", "error", "unavailable"}:
+            # section vide par défaut d'échec : on ne déclare pas tout supprimé, l'état client reste valable
+            manifest[name] = old
+            changes[name] = {"added": [], "changed": [], "removed": []}
+            continue
+        items = section_items(name, body[name])
+        manifest[name] = {sid: content_hash(item) for sid, item in items.items()}
+        changes[name] = {
+            "added": [{"syncId": sid, **items[sid]} for sid in manifest[name] if sid not in old],
+            "changed": [{"syncId": sid, **items[sid]} for sid, h in manifest[name].items() if sid in old and old[sid] != h],
+            "removed": [sid for sid in old if sid not in manifest[name]],
+        }
+
+    # sections non demandées cette fois : l'état connu du client est conservé tel quel
+    for name, old in (previous or {}).items():
+        manifest.setdefault(name, old)
+
+    version = content_hash(manifest)
+    await manifest_store.put(user_key, version, manifest, secret)
+    return ORJSONResponse({
+        "cursor": version,
+        # curseur inconnu (expiré, redémarrage) : tout est renvoyé en "added", le client repart de zéro
+        "reset": previous is None,
+        "changes": changes,
+        "meta": {**meta, "sync_total_s": round(time.perf_counter()-t0, 3)},
+    })
 
 if __name__ == "__main__":
-    import os, uvicorn
+    import os, uvicorn, tempfile
     port = int(os.getenv("PORT", "8081"))
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="debug")  # <-- PAS "main:app"
+    if WORKERS > 1:
+        # plusieurs processus : même sel (clés de pool/cache identiques) et même fichier SQLite
+        # pour partager le cache et la coalescence ; hérités par les workers via l'environnement
+        os.environ.setdefault("POOL_SALT", POOL_SALT.decode())
+        os.environ.setdefault("CACHE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), f"pronote-cache-{os.getpid()}.sqlite3"))
+        uvicorn.run("main:app", host="0.0.0.0", port=port, log_level="debug", workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port, log_level="debug")  # <-- PAS "main:app"
 
 
@@ -0,0 +1,28 @@
+"""Tests de comportement : app en mode FAKE, sans réseau ni serveur Pronote.
+
+main.py lit sa configuration à l'import : l'environnement est fixé ici, avant
+le premier import. Les modes (MOCK, synthétique, FAKE) sont ensuite basculés
+test par test via monkeypatch sur les globales du module.
+
+    pip install -r requirements.txt pytest
+    pytest tests
+"""
+import os, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("MOCK", "0")
+os.environ.setdefault("PRONOTE_FAKE", "1")
+os.environ.setdefault("FAKE_LATENCY_S", "0")
+os.environ.setdefault("FAKE_JITTER_S", "0")
+os.environ.setdefault("FAKE_LOGIN_LATENCY_S", "0")
+os.environ.setdefault("SYNTH_GRADES_PER_PERIOD", "5")
+os.environ.setdefault("SYNTH_CONTENT_SIZE", "20")
+
+@pytest.fixture(scope="session")
+def main_module():
+    import main
+    return main
@@ -0,0 +1,129 @@
+import asyncio, time
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from fake_pronote import FakeClient, SyntheticData
+
+OPEN_S = 0.05
+
+@pytest.fixture
+def breaker(main_module):
+    return main_module.CircuitBreaker("server", "test", window_s=60, min_calls=4, failure_rate=0.5,
+                                      open_s=OPEN_S, probes=1)
+
+def trip(breaker):
+    while breaker.state == "closed":
+        breaker.record(False, breaker.admit())
+    assert breaker.state == "open"
+
+def test_opens_at_failure_rate(breaker):
+    for ok in (True, False, True):
+        breaker.record(ok, breaker.admit())
+    assert breaker.state == "closed"  # sous CIRCUIT_MIN_CALLS
+    breaker.record(False, breaker.admit())
+    assert breaker.state == "open"
+    assert breaker.retry_after() > 0
+
+def test_open_rejects_then_half_open_probe_closes(main_module, breaker):
+    trip(breaker)
+    with pytest.raises(main_module.CircuitOpen):
+        breaker.admit()
+    time.sleep(OPEN_S)
+    assert breaker.admit() is True
+    assert breaker.state == "half_open"
+    with pytest.raises(main_module.CircuitOpen):
+        breaker.admit()  # une seule sonde à la fois
+    breaker.record(True, True)
+    assert breaker.state == "closed"
+    assert breaker.admit() is False
+
+def test_failed_probe_reopens(breaker):
+    trip(breaker)
+    time.sleep(OPEN_S)
+    breaker.record(False, breaker.admit())
+    assert breaker.state == "open"
+    assert breaker.retry_after() > 0
+
+def test_neutral_outcomes(breaker):
+    for _ in range(10):
+        breaker.record(None, breaker.admit())
+    assert breaker.state == "closed"
+    assert breaker.stats()["calls"] == 0
+    trip(breaker)
+    time.sleep(OPEN_S)
+    # sonde neutre (annulée, limiteur plein) : libère la place sans trancher
+    breaker.record(None, breaker.admit())
+    assert breaker.state == "half_open"
+    assert breaker.admit() is True
+
+@pytest.fixture
+def slot_breaker(main_module, monkeypatch):
+    b = main_module.CircuitBreaker("server", "slot-test", window_s=60, min_calls=2, failure_rate=0.5,
+                                   open_s=OPEN_S, probes=1)
+    monkeypatch.setitem(main_module._breakers, ("server", "slot-test"), b)
+    return b
+
+def test_slot_records_outcomes(main_module, slot_breaker):
+    with main_module.upstream_slot("server", "slot-test"):
+        pass
+    for exc in (main_module.SectionCancelled(), HTTPException(503, "upstream_busy")):
+        with pytest.raises(type(exc)):
+            with main_module.upstream_slot("server", "slot-test"):
+                raise exc
+    stats = slot_breaker.stats()
+    assert (stats["calls"], stats["failures"]) == (1, 0)
+    with pytest.raises(RuntimeError):
+        with main_module.upstream_slot("server", "slot-test"):
+            raise RuntimeError("down")
+    assert slot_breaker.state == "open"
+
+def test_slot_fails_fast_when_open(main_module, slot_breaker):
+    trip(slot_breaker)
+    with pytest.raises(main_module.CircuitOpen):
+        with main_module.upstream_slot("server", "slot-test", main_module.Deadline(5)):
+            pytest.fail("appel passé malgré le disjoncteur ouvert")
+    with pytest.raises(HTTPException) as err:
+        with main_module.upstream_slot("server", "slot-test"):
+            pytest.fail("login passé malgré le disjoncteur ouvert")
+    assert err.value.status_code == 503
+    assert err.value.detail == "upstream_unavailable"
+
+def test_nested_failure_counted_once(main_module, slot_breaker, monkeypatch):
+    inner = main_module.CircuitBreaker("ent", "slot-test", window_s=60, min_calls=2, failure_rate=0.5,
+                                       open_s=OPEN_S, probes=1)
+    monkeypatch.setitem(main_module._breakers, ("ent", "slot-test"), inner)
+    with pytest.raises(RuntimeError):
+        with main_module.upstream_slot("server", "slot-test"), main_module.upstream_slot("ent", "slot-test"):
+            raise RuntimeError("ent down")
+    assert inner.stats()["failures"] == 1
+    assert slot_breaker.stats()["failures"] == 0
+
+def test_notes_probe_reaches_the_server(main_module, slot_breaker):
+    # la lecture locale de client.periods ne doit pas servir de sonde : c'est l'appel des notes qui tranche
+    client = FakeClient("slot-test", data=SyntheticData(periods=1, grades_per_period=2), latency_s=0,
+                        jitter_s=0, login_latency_s=0, fail_rate=1.0)
+    trip(slot_breaker)
+    time.sleep(OPEN_S)
+    with pytest.raises(Exception):
+        main_module.build_notes(client, main_module.Deadline(5))
+    assert slot_breaker.state == "open"
+
+def fetch(main_module, sections, username):
+    payload = main_module.FetchPayload(username=username, password="pw")
+    return asyncio.run(main_module.pronote_fetch(payload, sections, None, None, None))
+
+def test_open_ent_keeps_cached_sections(main_module, monkeypatch):
+    assert fetch(main_module, "notes", "ent-down").status_code == 200
+    ent = main_module.CircuitBreaker("ent", "atrium_sud", window_s=60, min_calls=1, failure_rate=0.5,
+                                     open_s=60, probes=1)
+    monkeypatch.setitem(main_module._breakers, ("ent", "atrium_sud"), ent)
+    trip(ent)
+
+    body = orjson.loads(fetch(main_module, "notes,homework_next7", "ent-down").body)
+    assert body["meta"]["status"] == {"notes": "cached", "homework_next7": "unavailable"}
+    assert body["meta"]["errors"] == {"homework_next7": "circuit_open"}
+    with pytest.raises(HTTPException) as err:
+        fetch(main_module, "notes", "ent-down-no-cache")
+    assert err.value.status_code == 503
@@ -0,0 +1,35 @@
+import asyncio
+
+import orjson
+import pytest
+
+@pytest.fixture(params=["mock", "synthetic", "fake"])
+def mode(request, main_module, monkeypatch):
+    monkeypatch.setattr(main_module, "MOCK", request.param != "fake")
+    monkeypatch.setattr(main_module, "MOCK_SYNTHETIC", request.param == "synthetic")
+    return request.param
+
+def fetch(main_module, username, stream=None, if_none_match=None):
+    payload = main_module.FetchPayload(username=username, password="pw")
+    async def run():
+        resp = await main_module.pronote_fetch(payload, None, stream, None, if_none_match)
+        if stream:
+            return resp, [orjson.loads(line) async for line in resp.body_iterator]
+        return resp, orjson.loads(resp.body) if resp.body else None
+    return asyncio.run(run())
+
+def test_hashes_match_content(main_module, mode):
+    resp, body = fetch(main_module, f"hash-{mode}")
+    hashes = body["meta"]["hashes"]
+    assert list(hashes) == list(main_module.SECTIONS)
+    assert hashes == {name: main_module.content_hash(body[name]) for name in main_module.SECTIONS}
+    assert resp.headers["ETag"] == main_module.etag_for(hashes, *(
+        main_module.date.fromisoformat(d) for r in ("range_past", "range_next7") for d in body["meta"][r].values()))
+
+    # deuxième passage (cache en REAL) : mêmes hashes, 304 sur l'ETag
+    again, _ = fetch(main_module, f"hash-{mode}", if_none_match=resp.headers["ETag"])
+    assert again.status_code == 304
+
+    _, events = fetch(main_module, f"hash-{mode}", stream="ndjson")
+    streamed = {e["section"]: e["hash"] for e in events if e["section"] in hashes}
+    assert streamed == hashes
@@ -0,0 +1,34 @@
+import asyncio
+
+import orjson
+import pytest
+
+MODES = {
+    "mock":      {"MOCK": True,  "MOCK_SYNTHETIC": False},
+    "synthetic": {"MOCK": True,  "MOCK_SYNTHETIC": True},
+    "fake":      {"MOCK": False, "PRONOTE_FAKE": True},
+}
+
+@pytest.fixture(params=list(MODES))
+def mode(request, main_module, monkeypatch):
+    for name, value in MODES[request.param].items():
+        monkeypatch.setattr(main_module, name, value)
+    return request.param
+
+def sync(main_module, cursor=None, username="sync-user"):
+    payload = main_module.SyncPayload(username=username, password="pw", cursor=cursor)
+    return orjson.loads(asyncio.run(main_module.pronote_sync(payload)).body)
+
+def test_sync_full_then_incremental(main_module, mode):
+    first = sync(main_module, username=f"sync-{mode}")
+    assert first["reset"] is True
+    assert set(first["changes"]) == set(main_module.SECTIONS)
+    assert all(status not in {"timeout", "error", "unavailable"} for status in first["meta"]["status"].values())
+    assert first["changes"]["notes"]["added"]
+    assert all(item["syncId"] for item in first["changes"]["notes"]["added"])
+
+    second = sync(main_module, first["cursor"], username=f"sync-{mode}")
+    assert second["reset"] is False
+    assert second["cursor"] == first["cursor"]
+    for changes in second["changes"].values():
+        assert changes == {"added": [], "changed": [], "removed": []}